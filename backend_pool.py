@@ -0,0 +1,170 @@
+"""Pool of UDP time backends with health checking and load balancing.
+
+`SERVER_IP` may list several backends ("a,b:5679,c"), and a name that
+resolves to several addresses (a scaled docker compose service) counts as
+one backend per address. Names are re-resolved periodically.
+
+Selection is "power of two choices": pick two usable backends at random
+and send to the one with the lower latency score (EWMA latency, scaled by
+in-flight requests and by the re-admission weight).
+
+A background thread probes every backend. A backend that misses
+`eject_after` requests/probes in a row is ejected: it stops receiving
+traffic but keeps being probed. That includes a backend in ADMIN_CRASH
+mode, which silently ignores time requests. After `readmit_after`
+successful probes it is re-admitted in "recovering" state. Its weight
+then ramps from 10% to 100% over `slow_start` seconds, so it receives a
+growing share of traffic instead of all of it at once.
+"""
+import random
+import socket
+import threading
+import time
+
+HEALTHY = "healthy"
+RECOVERING = "recovering"
+EJECTED = "ejected"
+
+
+def parse_backends(spec, default_port):
+    """'a, b:5679' -> [('a', 5678), ('b', 5679)]"""
+    backends = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        host, _, port = item.partition(":")
+        backends.append((host, int(port) if port else default_port))
+    return backends
+
+
+class Backend:
+    EWMA_ALPHA = 0.3
+
+    def __init__(self, name, address):
+        self.name = name
+        self.address = address
+        self.state = HEALTHY
+        self.latency = None       # EWMA of successful RTTs, seconds
+        self.failures = 0         # consecutive failures
+        self.probe_successes = 0  # consecutive successful probes while ejected
+        self.in_flight = 0
+        self.readmitted_at = None
+        self.version = None       # negotiated protocol version (None = not yet, 0 = text)
+
+    def weight(self, slow_start):
+        if self.state != RECOVERING:
+            return 1.0
+        ramp = (time.monotonic() - self.readmitted_at) / slow_start
+        return min(1.0, 0.1 + 0.9 * ramp)
+
+    def label(self):
+        return f"{self.address[0]}:{self.address[1]}"
+
+
+class BackendPool:
+    def __init__(self, hosts, probe, probe_interval=2.0, eject_after=3, readmit_after=3,
+                 slow_start=10.0, resolve_interval=30.0):
+        self.hosts = hosts
+        self.probe = probe  # callable(backend) -> rtt seconds, raises on failure
+        self.probe_interval = probe_interval
+        self.eject_after = eject_after
+        self.readmit_after = readmit_after
+        self.slow_start = slow_start
+        self.resolve_interval = resolve_interval
+        self.backends = {}  # address -> Backend
+        self._lock = threading.Lock()
+        self._resolved_at = 0.0
+        self._thread = None
+        self.resolve()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._probe_loop, name="backend-probes", daemon=True)
+        self._thread.start()
+        return self
+
+    # --- membership ---
+
+    def resolve(self):
+        found = {}
+        for host, port in self.hosts:
+            try:
+                infos = socket.getaddrinfo(host, port, socket.AF_INET, socket.SOCK_DGRAM)
+            except socket.gaierror:
+                continue
+            for info in infos:
+                found.setdefault(info[4], host)
+        with self._lock:
+            # Keep existing state; on a failed lookup keep the old list
+            if found:
+                self.backends = {address: self.backends.get(address) or Backend(name, address)
+                                 for address, name in found.items()}
+        self._resolved_at = time.monotonic()
+
+    def snapshot(self):
+        with self._lock:
+            return sorted(self.backends.values(), key=lambda b: b.address)
+
+    def get(self, label):
+        for backend in self.snapshot():
+            if backend.label() == label:
+                return backend
+        return None
+
+    # --- selection ---
+
+    def _score(self, backend):
+        latency = backend.latency if backend.latency is not None else 0.0
+        return (latency + 1e-4) * (backend.in_flight + 1) / backend.weight(self.slow_start)
+
+    def choose(self, exclude=()):
+        """Power of two choices over usable backends. Falls back to ejected
+        ones when nothing else is left, so a request is still attempted."""
+        backends = [b for b in self.snapshot() if b.address not in exclude]
+        usable = [b for b in backends if b.state != EJECTED] or backends
+        if not usable:
+            raise socket.gaierror(f"no backend address for {self.hosts}")
+        if len(usable) == 1:
+            chosen = usable[0]
+        else:
+            first, second = random.sample(usable, 2)
+            chosen = first if self._score(first) <= self._score(second) else second
+        with self._lock:
+            chosen.in_flight += 1
+        return chosen
+
+    def release(self, backend, rtt=None):
+        """Report the outcome of a request sent with `choose()`."""
+        with self._lock:
+            backend.in_flight -= 1
+        self._record(backend, rtt)
+
+    # --- health ---
+
+    def _record(self, backend, rtt, probe=False):
+        with self._lock:
+            if rtt is not None:
+                backend.latency = rtt if backend.latency is None else (
+                    (1 - Backend.EWMA_ALPHA) * backend.latency + Backend.EWMA_ALPHA * rtt)
+                backend.failures = 0
+                if backend.state == EJECTED and probe:
+                    backend.probe_successes += 1
+                    if backend.probe_successes >= self.readmit_after:
+                        backend.state = RECOVERING
+                        backend.readmitted_at = time.monotonic()
+                elif backend.state == RECOVERING and backend.weight(self.slow_start) >= 1.0:
+                    backend.state = HEALTHY
+            else:
+                backend.failures += 1
+                backend.probe_successes = 0
+                if backend.state != EJECTED and backend.failures >= self.eject_after:
+                    backend.state = EJECTED
+
+    def _probe_loop(self):
+        while True:
+            if time.monotonic() - self._resolved_at >= self.resolve_interval:
+                self.resolve()
+            for backend in self.snapshot():
+                try:
+                    rtt = self.probe(backend)
+                except Exception:
+                    rtt = None
+                self._record(backend, rtt, probe=True)
+            time.sleep(self.probe_interval)
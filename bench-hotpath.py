@@ -0,0 +1,143 @@
+"""Micro-benchmark: per-packet CPU cost of the UDP backend's receive/reply loop.
+
+Compares the original loop (recvfrom + decode + strftime + encode + print)
+with the zero-allocation fast path in udp-backend.py. Everything runs over
+loopback sockets in one process, and only the server-side handling is timed.
+It also times fault injection: scheduling a delayed reply while `--pending`
+others wait on the timer wheel, and expiring them.
+
+    python bench-hotpath.py [--packets 200000] [--batch 128] [--pending 200000]
+"""
+import argparse
+import importlib.util
+import os
+import socket
+import time
+import types
+from datetime import datetime
+
+import fault_injection
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_backend():
+    # udp-backend.py has a dash in its name, so it is loaded by path
+    spec = importlib.util.spec_from_file_location("udp_backend", os.path.join(HERE, "udp-backend.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def legacy_serve(UDPServerSocket, is_server_healthy, limit, out):
+    """The original per-packet path, kept verbatim as the baseline."""
+    for _ in range(limit):
+        message, clientAddress = UDPServerSocket.recvfrom(1024)
+        decoded_message = message.decode()
+        if decoded_message == "ADMIN_CRASH":
+            is_server_healthy.value = False
+        elif decoded_message == "ADMIN_REPAIR":
+            is_server_healthy.value = True
+        elif decoded_message == "REQUEST_TIME":
+            if is_server_healthy.value:
+                current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+                if out is not None:
+                    print(f"Request from {clientAddress} -> Responded: {current_time}", file=out)
+                UDPServerSocket.sendto(current_time.encode(), clientAddress)
+        else:
+            UDPServerSocket.sendto("INVALID_REQUEST".encode(), clientAddress)
+
+
+def make_pair():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+    server.bind(("127.0.0.1", 0))
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+    client.bind(("127.0.0.1", 0))
+    return server, client
+
+
+def measure(handler, packets, batch):
+    """Return CPU nanoseconds per packet spent inside `handler`."""
+    server, client = make_pair()
+    target = server.getsockname()
+    spent = 0
+    done = 0
+    with server, client:
+        while done < packets:
+            n = min(batch, packets - done)
+            for _ in range(n):
+                client.sendto(b"REQUEST_TIME", target)
+            start = time.process_time_ns()
+            handler(server, n)
+            spent += time.process_time_ns() - start
+            for _ in range(n):
+                client.recv(64)
+            done += n
+    return spent / packets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--packets", type=int, default=200_000)
+    parser.add_argument("--batch", type=int, default=128)
+    parser.add_argument("--pending", type=int, default=200_000)
+    args = parser.parse_args()
+
+    backend = load_backend()
+    backend.LOG_REQUESTS = False
+    healthy = types.SimpleNamespace(value=True)
+
+    def serve(sock, n, kernel_timestamps):
+        backend.KERNEL_TIMESTAMPS = kernel_timestamps
+        backend.serve(sock, healthy, n)
+
+    with open(os.devnull, "w") as devnull:
+        cases = [
+            ("before: original loop (print to /dev/null)", lambda s, n: legacy_serve(s, healthy, n, devnull)),
+            ("before: original loop without print", lambda s, n: legacy_serve(s, healthy, n, None)),
+            ("after:  fast path (recvfrom_into, cached prefix)", lambda s, n: serve(s, n, kernel_timestamps=False)),
+            ("after:  fast path + kernel receive timestamps", lambda s, n: serve(s, n, kernel_timestamps=True)),
+        ]
+        print(f"{args.packets} REQUEST_TIME packets, batches of {args.batch}")
+        for name, handler in cases:
+            print(f"  {name:<52} {measure(handler, args.packets, args.batch):8.0f} ns/packet")
+
+    formatter = backend.TimestampFormatter()
+    rounds = 200_000
+    start = time.process_time_ns()
+    for _ in range(rounds):
+        datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f').encode()
+    legacy_cost = (time.process_time_ns() - start) / rounds
+    start = time.process_time_ns()
+    for _ in range(rounds):
+        formatter.stamp()
+    fast_cost = (time.process_time_ns() - start) / rounds
+    print("timestamp formatting only")
+    print(f"  {'strftime + encode':<52} {legacy_cost:8.0f} ns/call")
+    print(f"  {'TimestampFormatter.stamp':<52} {fast_cost:8.0f} ns/call")
+
+    config = fault_injection.shared_config()
+    fault_injection.apply(config, fault_injection.parse_command("delay=uniform:1000:5000 seed=1"))
+    sent = []
+    injector = fault_injection.FaultInjector(config, lambda data, address: sent.append(data))
+    reply, address = formatter.stamp(), ("127.0.0.1", 9)
+    for _ in range(args.pending):
+        injector.submit(reply, address)
+    start = time.process_time_ns()
+    for _ in range(rounds):
+        injector.submit(reply, address)
+        injector.flush()
+    submit_cost = (time.process_time_ns() - start) / rounds
+    pending = injector.pending
+    start = time.process_time_ns()
+    injector.flush(time.monotonic() + 6)
+    expire_cost = (time.process_time_ns() - start) / max(1, len(sent))
+    print(f"fault injection (delay=uniform:1000:5000, {pending} replies pending)")
+    print(f"  {'submit + flush check':<52} {submit_cost:8.0f} ns/packet")
+    print(f"  {'expiring the whole backlog':<52} {expire_cost:8.0f} ns/reply")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Background clock synchronizer: serve the backend's time without a round trip.
+
+A thread samples the backend every `interval` seconds. Each sample gives an
+NTP clock offset and round-trip delay (udp_protocol.offset_and_delay). It is
+stored as `theta`: the backend's time minus our *monotonic* clock, so a step
+of the local wall clock does not disturb the estimate.
+
+From the last `window` samples:
+  * the anchor is the sample with the lowest delay (the NTP clock filter:
+    less queueing means a tighter bound);
+  * the drift is the least-squares slope of theta over monotonic time, i.e.
+    how fast the backend's clock runs relative to ours (taken as zero until
+    it is significant against the measurement jitter).
+
+The backend time at monotonic instant m is then estimated as
+    m + theta_anchor + drift * (m - m_anchor)
+with an error bound of
+    delay_anchor / 2 + residual spread + age * drift_uncertainty.
+
+If no sample has succeeded for `stale_after` seconds the estimate is marked
+stale, and callers should fall back to a live round trip.
+
+`filter_probes` applies the same clock filter to the probes of one
+multi-probe sync (UdpChannel.request_burst).
+"""
+import collections
+import threading
+import time
+
+Sample = collections.namedtuple("Sample", "mono theta delay")
+Estimate = collections.namedtuple(
+    "Estimate", "server_time error offset drift age since_sample samples stale")
+ProbeResult = collections.namedtuple("ProbeResult", "offset delay error spread best accepted rejected")
+
+# Clamp on the fitted drift: real oscillators are within a few hundred ppm
+MAX_DRIFT = 500e-6
+
+
+def filter_probes(probes):
+    """Pick one (offset, delay) pair out of a burst of probes.
+
+    The probe with the lowest delay wins. Every probe bounds the true offset
+    to offset +- delay/2. A probe whose bound does not overlap the winner's
+    is an outlier (e.g. a reply stamped late by a stalled server) and is
+    rejected. The error bound is the winner's delay/2. The spread is the RMS
+    distance of the accepted offsets from the winner's (NTP's jitter).
+    `best` is the winner's index in `probes`.
+    """
+    best = min(range(len(probes)), key=lambda i: probes[i][1])
+    offset, delay = probes[best]
+    accepted = [o for o, d in probes if abs(o - offset) <= (d + delay) / 2]
+    spread = (sum((o - offset) ** 2 for o in accepted) / len(accepted)) ** 0.5
+    return ProbeResult(offset, delay, delay / 2, spread, best, len(accepted), len(probes) - len(accepted))
+
+
+class ClockSynchronizer:
+    def __init__(self, sample, interval=2.0, window=8, stale_after=10.0, drift_uncertainty=100e-6):
+        self.sample = sample  # callable() -> (offset seconds, delay seconds)
+        self.interval = interval
+        self.stale_after = stale_after
+        self.drift_uncertainty = drift_uncertainty
+        self._samples = collections.deque(maxlen=window)
+        self._fit = None  # (anchor Sample, drift, residual)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.failures = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="clock-sync", daemon=True)
+        self._thread.start()
+        return self
+
+    def add_sample(self, offset, delay):
+        """Record an NTP offset/delay measured just now (also used by live syncs)."""
+        mono = time.monotonic()
+        theta = time.time() + offset - mono
+        with self._lock:
+            self._samples.append(Sample(mono, theta, delay))
+            self._fit = self._compute_fit(list(self._samples))
+
+    @staticmethod
+    def _compute_fit(samples):
+        anchor = min(samples, key=lambda s: s.delay)
+        drift = 0.0
+        span = samples[-1].mono - samples[0].mono
+        if len(samples) >= 3 and span > 1.0:
+            mean_m = sum(s.mono for s in samples) / len(samples)
+            mean_t = sum(s.theta for s in samples) / len(samples)
+            var = sum((s.mono - mean_m) ** 2 for s in samples)
+            slope = sum((s.mono - mean_m) * (s.theta - mean_t) for s in samples) / var
+            # Only trust the slope when it stands out of the jitter (> 3 standard errors)
+            sse = sum((s.theta - mean_t - slope * (s.mono - mean_m)) ** 2 for s in samples)
+            stderr = (sse / (len(samples) - 2) / var) ** 0.5
+            if abs(slope) > 3 * stderr:
+                drift = max(-MAX_DRIFT, min(MAX_DRIFT, slope))
+        residual = max(abs(s.theta - (anchor.theta + drift * (s.mono - anchor.mono))) for s in samples)
+        return anchor, drift, residual
+
+    def estimate(self):
+        """Current Estimate, or None before the first sample."""
+        with self._lock:
+            if self._fit is None:
+                return None
+            anchor, drift, residual = self._fit
+            latest = self._samples[-1].mono
+            count = len(self._samples)
+        mono = time.monotonic()
+        age = mono - anchor.mono
+        theta = anchor.theta + drift * age
+        server_time = mono + theta
+        return Estimate(
+            server_time=server_time,
+            error=anchor.delay / 2 + residual + age * self.drift_uncertainty,
+            offset=server_time - time.time(),
+            drift=drift,
+            age=age,
+            since_sample=mono - latest,
+            samples=count,
+            stale=mono - latest > self.stale_after,
+        )
+
+    def _run(self):
+        while True:
+            try:
+                offset, delay = self.sample()
+            except Exception:
+                self.failures += 1
+            else:
+                self.add_sample(offset, delay)
+            time.sleep(self.interval)
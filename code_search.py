@@ -0,0 +1,227 @@
+"""In-memory trigram index for searching the source tree.
+
+Every indexed file gets a document ID, and each distinct (ASCII
+case-folded) three-byte sequence in it maps to a posting list of the IDs
+that contain it. A query literal can only occur in files that contain all
+of its trigrams, so a search intersects those posting lists, starting with
+the shortest. Only the few candidate files left are read and scanned for
+matching lines.
+
+The index is built by a background thread and kept current by rescanning
+the tree every `rescan_interval` seconds. A file whose (mtime, size)
+changed is re-indexed under a new ID and its old ID is marked dead. IDs
+only ever grow, so posting lists stay sorted and are appended to, never
+edited in place. Once dead IDs outnumber live ones, the postings are
+rebuilt without them and swapped in whole.
+
+Which files are indexed is decided by a `SearchPolicy`: directories to
+skip, a maximum file size, and binary detection (a NUL byte in the first
+8 KiB, as git does).
+"""
+import array
+import os
+import threading
+import time
+
+BINARY_SNIFF = 8192
+
+
+class SearchPolicy:
+    def __init__(self, max_file_size=1 << 20, skip_dirs=(".git", "__pycache__", "node_modules", ".venv"),
+                 skip_binary=True):
+        self.max_file_size = max_file_size
+        self.skip_dirs = set(skip_dirs)
+        self.skip_binary = skip_binary
+
+    def is_binary(self, data):
+        return self.skip_binary and b"\0" in data[:BINARY_SNIFF]
+
+
+def trigrams(data):
+    """Distinct case-folded trigrams of `data` (bytes), as tuples of three
+    byte values (zip over shifted views is the fastest pure-Python way)."""
+    data = data.lower()
+    return set(zip(data, data[1:], data[2:]))
+
+
+class CodeSearch:
+    def __init__(self, root, policy=None, rescan_interval=5.0):
+        self.root = root
+        self.policy = policy or SearchPolicy()
+        self.rescan_interval = rescan_interval
+        self._lock = threading.Lock()
+        self._postings = {}      # trigram -> array('I') of document IDs, ascending
+        self._paths = []         # document ID -> relative path (None once dead)
+        self._files = {}         # relative path -> (document ID or None if skipped, mtime_ns, size, skip reason)
+        self._thread = None
+        self.ready = False       # first full scan finished
+        self.dead = 0
+        self.scans = 0
+        self.last_scan_seconds = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="code-search", daemon=True)
+        self._thread.start()
+        return self
+
+    # --- indexing (background thread only) ---
+
+    def _walk(self):
+        """(relative path, stat) for every regular file under root."""
+        stack = [self.root]
+        while stack:
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in self.policy.skip_dirs:
+                            stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield os.path.relpath(entry.path, self.root), entry.stat()
+                except OSError:
+                    continue
+
+    def scan(self):
+        """Bring the index up to date with the tree: add new and changed files,
+        drop deleted ones. Returns the number of files (re)indexed."""
+        started = time.monotonic()
+        seen = set()
+        changed = 0
+        for path, stat in self._walk():
+            seen.add(path)
+            known = self._files.get(path)
+            if known is not None and known[1:3] == (stat.st_mtime_ns, stat.st_size):
+                continue
+            self._index_file(path, stat)
+            changed += 1
+        for path in [p for p in self._files if p not in seen]:
+            with self._lock:
+                self._remove(path)
+        if self.dead > 1000 and self.dead > len(self._files):
+            self._compact()
+        self.scans += 1
+        self.last_scan_seconds = time.monotonic() - started
+        self.ready = True
+        return changed
+
+    def _index_file(self, path, stat):
+        """Index one file, or remember why the policy skipped it."""
+        if stat.st_size > self.policy.max_file_size:
+            reason = "too_large"
+        else:
+            try:
+                with open(os.path.join(self.root, path), "rb") as f:
+                    data = f.read(self.policy.max_file_size + 1)
+                reason = "binary" if self.policy.is_binary(data) else None
+            except OSError:
+                reason = "unreadable"
+        if reason:
+            # Keep remembering the file so it is not re-read on every scan
+            with self._lock:
+                self._remove(path)
+                self._files[path] = (None, stat.st_mtime_ns, stat.st_size, reason)
+            return
+        grams = trigrams(data)
+        with self._lock:
+            self._remove(path)
+            doc = len(self._paths)
+            self._paths.append(path)
+            self._files[path] = (doc, stat.st_mtime_ns, stat.st_size, None)
+            postings = self._postings
+            for gram in grams:
+                posting = postings.get(gram)
+                if posting is None:
+                    posting = postings[gram] = array.array("I")
+                posting.append(doc)
+
+    def _remove(self, path):
+        """Caller holds the lock."""
+        known = self._files.pop(path, None)
+        if known is not None and known[0] is not None:
+            self._paths[known[0]] = None
+            self.dead += 1
+
+    def _compact(self):
+        """Rebuild the postings without dead IDs, then swap them in."""
+        with self._lock:
+            postings = dict(self._postings)
+            paths = list(self._paths)
+        alive = bytearray(path is not None for path in paths)
+        rebuilt = {}
+        for gram, posting in postings.items():
+            kept = array.array("I", (doc for doc in posting if alive[doc]))
+            if kept:
+                rebuilt[gram] = kept
+        with self._lock:
+            # New documents may only have been added by this same thread, so nothing was missed
+            self._postings = rebuilt
+            self.dead = 0
+
+    def _run(self):
+        while True:
+            try:
+                self.scan()
+            except Exception:
+                pass
+            time.sleep(self.rescan_interval)
+
+    # --- queries ---
+
+    def candidates(self, query):
+        """Paths of indexed files that contain every trigram of `query`."""
+        grams = trigrams(query.encode())
+        with self._lock:
+            lists = sorted((self._postings.get(g, ()) for g in grams), key=len)
+            if not lists or not lists[0]:
+                return []
+            docs = set(lists[0])
+            for posting in lists[1:]:
+                docs.intersection_update(posting)
+                if not docs:
+                    break
+            return sorted(p for p in map(self._paths.__getitem__, docs) if p is not None)
+
+    def search(self, query, max_results=200):
+        """Lines containing `query` (at least 3 characters, ASCII
+        case-insensitive), as dicts with path, line (1-based) and text."""
+        needle = query.encode().lower()
+        results = []
+        files = self.candidates(query)
+        for path in files:
+            try:
+                with open(os.path.join(self.root, path), "rb") as f:
+                    data = f.read(self.policy.max_file_size + 1)
+            except OSError:
+                continue
+            folded = data.lower()
+            pos = folded.find(needle)
+            line, counted = 1, 0
+            while pos != -1:
+                line += data.count(b"\n", counted, pos)
+                start = data.rfind(b"\n", 0, pos) + 1
+                end = data.find(b"\n", pos)
+                end = len(data) if end == -1 else end
+                text = data[start:end].decode("utf-8", errors="replace").strip()
+                results.append({"path": path, "line": line, "text": text[:300]})
+                if len(results) >= max_results:
+                    return results, files, True
+                counted = pos
+                pos = folded.find(needle, end)  # next matching line
+        return results, files, False
+
+    def stats(self):
+        skipped = {"binary": 0, "too_large": 0, "unreadable": 0}
+        with self._lock:
+            for known in self._files.values():
+                if known[3]:
+                    skipped[known[3]] += 1
+            indexed = len(self._files) - sum(skipped.values())
+            trigram_count = len(self._postings)
+        return {"ready": self.ready, "indexed_files": indexed, "trigrams": trigram_count,
+                "skipped": skipped, "scans": self.scans,
+                "last_scan_ms": round(self.last_scan_seconds * 1000, 1) if self.last_scan_seconds is not None else None}
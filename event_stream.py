@@ -0,0 +1,105 @@
+"""Shared ticker that fans Server-Sent Events out to many subscribers.
+
+One thread ticks every `tick` seconds, aligned to the wall clock. Each tick is
+serialized once into an SSE frame (`make_frame(tick_number)` -> bytes) and
+handed to every subscriber whose interval is due. Subscribers pick an
+interval that is a whole number of ticks. While nobody is subscribed the
+thread just waits.
+
+Each subscriber has a bounded queue (a deque with `maxlen`). A consumer that
+falls behind therefore has its oldest undelivered ticks coalesced away: for a
+clock only the latest one matters. If it has not read anything for
+`drop_after` seconds it is dropped and its stream ends, so a stuck client
+costs at most one small queue and never delays the ticker or the others.
+"""
+import collections
+import threading
+import time
+
+
+class Subscriber:
+    def __init__(self, every, queue_size):
+        self.every = every  # deliver every N-th tick
+        self.queue = collections.deque(maxlen=queue_size)
+        self.ready = threading.Event()
+        self.last_read = time.monotonic()
+        self.coalesced = 0
+        self.closed = False
+
+    def next_frames(self, timeout):
+        """Frames queued since the last call ([] on timeout), or None once dropped."""
+        self.ready.wait(timeout)
+        self.ready.clear()
+        self.last_read = time.monotonic()
+        frames = []
+        while self.queue:
+            frames.append(self.queue.popleft())
+        if not frames and self.closed:
+            return None
+        return frames
+
+
+class Ticker:
+    def __init__(self, make_frame, tick=0.1, queue_size=8, drop_after=30.0):
+        self.make_frame = make_frame
+        self.tick = tick
+        self.queue_size = queue_size
+        self.drop_after = drop_after
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread = None
+        self.ticks = 0
+        self.frames = 0     # ticks actually serialized (someone was due)
+        self.dropped = 0    # subscribers disconnected for not reading
+
+    def subscribe(self, interval):
+        every = max(1, round(interval / self.tick))
+        subscriber = Subscriber(every, self.queue_size)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sse-ticker", daemon=True)
+                self._thread.start()
+            self._subscribers.add(subscriber)
+            self._wakeup.notify()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._subscribers:
+                    self._wakeup.wait()
+            # Sleep to the next tick boundary so ticks land on whole seconds
+            now = time.time()
+            time.sleep(self.tick - now % self.tick)
+            self.ticks = number = round(time.time() / self.tick)
+            with self._lock:
+                due = [s for s in self._subscribers if number % s.every == 0]
+            if not due:
+                continue
+            frame = self.make_frame(number)
+            self.frames += 1
+            stale = time.monotonic() - self.drop_after
+            for subscriber in due:
+                if len(subscriber.queue) == subscriber.queue.maxlen:
+                    subscriber.coalesced += 1
+                    if subscriber.last_read < stale:
+                        self._drop(subscriber)
+                        continue
+                subscriber.queue.append(frame)
+                subscriber.ready.set()
+
+    def _drop(self, subscriber):
+        subscriber.closed = True
+        subscriber.queue.clear()
+        subscriber.ready.set()
+        self.dropped += 1
+        self.unsubscribe(subscriber)
@@ -0,0 +1,250 @@
+"""Fault injection for the UDP backend: drop, delay, duplicate and reorder time replies.
+
+The settings live in shared memory (`shared_config()`, an array of doubles),
+so an ADMIN_FAULT command received by one worker applies to all of them,
+like the crash flag. Field 0 is a generation counter used as a seqlock. The
+writer makes it odd, updates the fields, then makes it even again. Workers
+compare it once per packet and only re-read the settings when it changed.
+
+    ADMIN_FAULT drop=0.05 delay=uniform:5:50 dup=0.01 reorder=0.1:20 seed=42
+    ADMIN_FAULT off
+
+Probabilities are 0..1 and times are milliseconds. Settings not named keep
+their value, unless `off` (reset everything) comes first.
+  * delay: off, fixed:MS, uniform:LO:HI or pareto:SCALE:ALPHA (heavy tail,
+    never below SCALE)
+  * reorder: P[:WINDOW]. A reply is held back by up to WINDOW ms (default
+    20), so later replies overtake it.
+  * seed: N makes every worker's decisions reproducible. They restart from
+    the seed on each change. `seed=random` draws a fresh seed instead.
+
+Delayed replies wait on a hashed timer wheel. A ring of 1 ms slots is
+indexed by deadline tick, so scheduling is an append and expiry only
+touches the slots that came due. Hundreds of thousands of pending replies
+therefore cost the receive loop nothing until they are due.
+"""
+import math
+import multiprocessing
+import random
+import time
+
+FIELDS = ("generation", "drop", "duplicate", "reorder", "reorder_window", "latency", "a", "b", "seed")
+GENERATION, DROP, DUPLICATE, REORDER, REORDER_WINDOW, LATENCY, A, B, SEED = range(len(FIELDS))
+LATENCY_KINDS = ("off", "fixed", "uniform", "pareto")
+DEFAULTS = {"drop": 0.0, "duplicate": 0.0, "reorder": 0.0, "reorder_window": 0.02,
+            "latency": 0.0, "a": 0.0, "b": 0.0, "seed": math.nan}
+# Longest delay ever scheduled (Pareto tails are unbounded)
+MAX_DELAY = 30.0
+
+
+def shared_config():
+    """Settings shared by all workers ('d' = double, no lock: see the seqlock above)."""
+    config = multiprocessing.Array('d', len(FIELDS), lock=False)
+    for name, value in DEFAULTS.items():
+        config[FIELDS.index(name)] = value
+    return config
+
+
+def _probability(text):
+    value = float(text)
+    if not 0.0 <= value <= 1.0:
+        raise ValueError(f"probability out of range: {text}")
+    return value
+
+
+def _millis(text):
+    value = float(text)
+    if not 0.0 <= value <= MAX_DELAY * 1000:
+        raise ValueError(f"time out of range: {text}")
+    return value / 1000
+
+
+def parse_command(text):
+    """Settings named in an ADMIN_FAULT argument string, as {field: value}.
+    Raises ValueError on anything malformed."""
+    settings = {}
+    for word in text.split():
+        key, _, value = word.partition("=")
+        parts = value.split(":")
+        if word == "off":
+            settings.update(DEFAULTS)
+        elif key == "drop":
+            settings["drop"] = _probability(value)
+        elif key == "dup":
+            settings["duplicate"] = _probability(value)
+        elif key == "reorder":
+            settings["reorder"] = _probability(parts[0])
+            if len(parts) > 1:
+                settings["reorder_window"] = _millis(parts[1])
+        elif key == "delay":
+            kind = parts[0]
+            if kind not in LATENCY_KINDS or len(parts) != {"off": 1, "fixed": 2}.get(kind, 3):
+                raise ValueError(f"bad delay: {value}")
+            a = _millis(parts[1]) if len(parts) > 1 else 0.0
+            b = float(parts[2]) if kind == "pareto" else _millis(parts[2]) if len(parts) > 2 else 0.0
+            if (kind == "uniform" and b < a) or (kind == "pareto" and b <= 0):
+                raise ValueError(f"bad delay: {value}")
+            settings.update(latency=LATENCY_KINDS.index(kind), a=a, b=b)
+        elif key == "seed":
+            settings["seed"] = float(random.getrandbits(48) if value == "random" else int(value))
+        else:
+            raise ValueError(f"unknown setting: {word}")
+    return settings
+
+
+def apply(config, settings):
+    """Write settings into the shared config (seqlock writer side)."""
+    generation = int(config[GENERATION]) | 1  # odd: update in progress
+    config[GENERATION] = generation
+    for name, value in settings.items():
+        config[FIELDS.index(name)] = value
+    config[GENERATION] = generation + 1
+
+
+def describe(config):
+    """The current settings as an ADMIN_FAULT argument string."""
+    kind = LATENCY_KINDS[int(config[LATENCY])]
+    a, b = config[A] * 1000, config[B]
+    delay = {"off": "off", "fixed": f"fixed:{a:g}", "uniform": f"uniform:{a:g}:{b * 1000:g}",
+             "pareto": f"pareto:{a:g}:{b:g}"}[kind]
+    seed = "random" if math.isnan(config[SEED]) else int(config[SEED])
+    return (f"drop={config[DROP]:g} delay={delay} dup={config[DUPLICATE]:g} "
+            f"reorder={config[REORDER]:g}:{config[REORDER_WINDOW] * 1000:g} seed={seed}")
+
+
+class TimerWheel:
+    """Hashed timer wheel: `slots` buckets of `tick` seconds each, indexed by
+    deadline tick modulo the ring size. An entry further away than one turn
+    simply waits in its slot until its own tick comes round."""
+
+    def __init__(self, tick=0.001, slots=4096, now=None):
+        self.tick = tick
+        self.mask = slots - 1  # slots must be a power of two
+        self.slots = [[] for _ in range(slots)]
+        self.current = int((time.monotonic() if now is None else now) / tick)  # last tick expired
+        self.next_time = (self.current + 1) * tick
+        self.pending = 0
+
+    def schedule(self, delay, item, now):
+        deadline = max(int((now + delay) / self.tick), self.current + 1)
+        self.slots[deadline & self.mask].append((deadline, item))
+        self.pending += 1
+
+    def advance(self, now):
+        """Items whose deadline has passed, in deadline-slot order."""
+        until = int(now / self.tick)
+        due = []
+        if until <= self.current:
+            return due
+        if self.pending:
+            # Past one full turn every slot has been visited once
+            for tick in range(self.current + 1, self.current + 1 + min(until - self.current, self.mask + 1)):
+                slot = self.slots[tick & self.mask]
+                if not slot:
+                    continue
+                waiting = []
+                for entry in slot:
+                    if entry[0] <= until:
+                        due.append(entry[1])
+                    else:
+                        waiting.append(entry)
+                self.slots[tick & self.mask] = waiting
+            self.pending -= len(due)
+        self.current = until
+        self.next_time = (until + 1) * self.tick
+        return due
+
+
+class FaultInjector:
+    """One worker's view of the shared fault settings.
+
+    `submit(data, address)` is used in place of `sendto` for time replies:
+    it drops, sends, or schedules (copies of) the reply on the timer wheel.
+    Like `sendto`, it returns something truthy when the reply went out (or
+    is scheduled), and False when it was dropped.
+    The receive loop calls `refresh()` when the shared generation changed
+    and `flush()` to send replies that came due.
+    """
+
+    def __init__(self, config, send):
+        self.config = config
+        self.send = send
+        self.wheel = TimerWheel()
+        self.generation = None
+        self.active = False
+        self.counts = {"dropped": 0, "delayed": 0, "duplicated": 0, "reordered": 0}
+        self.refresh()
+
+    @property
+    def pending(self):
+        return self.wheel.pending
+
+    def refresh(self):
+        """Re-read the shared settings (seqlock reader side). Returns False,
+        keeping the old settings, if a write was in progress."""
+        config = self.config
+        generation = config[GENERATION]
+        values = config[:]
+        if generation % 2 or config[GENERATION] != generation:
+            return False
+        self.generation = generation
+        (_, self.drop, self.duplicate, self.reorder, self.reorder_window,
+         latency, self.a, self.b, seed) = values
+        self.latency = int(latency)
+        self.rng = random.Random(None if math.isnan(seed) else int(seed))
+        self.random = self.rng.random
+        self.active = bool(self.drop or self.duplicate or self.reorder or self.latency)
+        return True
+
+    def _delay(self):
+        kind = self.latency
+        if kind == 0:
+            return 0.0
+        if kind == 1:
+            return self.a
+        if kind == 2:
+            return self.a + (self.b - self.a) * self.random()
+        return min(self.a * self.rng.paretovariate(self.b), MAX_DELAY)
+
+    def submit(self, data, address):
+        random_ = self.random
+        if self.drop and random_() < self.drop:
+            self.counts["dropped"] += 1
+            return False
+        copies = 1
+        if self.duplicate and random_() < self.duplicate:
+            self.counts["duplicated"] += 1
+            copies = 2  # a duplicate takes its own path, so it gets its own delay
+        now = None
+        sent = False
+        for _ in range(copies):
+            delay = self._delay()
+            if self.reorder and random_() < self.reorder:
+                self.counts["reordered"] += 1
+                delay += self.reorder_window * random_()
+            if delay <= 0.0:
+                sent = self._send(data, address) or sent
+                continue
+            if now is None:
+                now = time.monotonic()
+                data = bytes(data)  # the caller reuses its reply buffer
+            self.counts["delayed"] += 1
+            self.wheel.schedule(delay, (data, address), now)
+            sent = True
+        return sent
+
+    def flush(self, now=None):
+        """Send every delayed reply that is due."""
+        now = time.monotonic() if now is None else now
+        if now < self.wheel.next_time:
+            return
+        for data, address in self.wheel.advance(now):
+            self._send(data, address)
+
+    def _send(self, data, address):
+        try:
+            self.send(data, address)
+        except OSError:
+            self.counts["dropped"] += 1  # send buffer full: lost like any other datagram
+            return False
+        return True
@@ -0,0 +1,98 @@
+"""Log-bucketed (HDR-style) histogram for latency measurements.
+
+Values are non-negative integers (e.g. microseconds). Values below
+2 * SUB_BUCKETS get their own bucket; above that every power of two is split
+into SUB_BUCKETS linear sub-buckets, so the relative error of any reported
+percentile stays below 1 / SUB_BUCKETS (about 3%) over the whole range.
+Recording is a bit_length, a shift and a list increment.
+
+Histograms merge by adding counts, so separate processes can each record
+and send `counts` to a parent.
+"""
+SUB_BITS = 5
+SUB_BUCKETS = 1 << SUB_BITS
+
+
+def bucket_index(value):
+    if value < 2 * SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BITS - 1
+    return (shift << SUB_BITS) + (value >> shift)
+
+
+def bucket_bounds(index):
+    """[low, high) range of values that land in bucket `index`."""
+    if index < 2 * SUB_BUCKETS:
+        return index, index + 1
+    shift = (index >> SUB_BITS) - 1
+    low = (index - (shift << SUB_BITS)) << shift
+    return low, low + (1 << shift)
+
+
+class LogHistogram:
+    def __init__(self, counts=None):
+        self.counts = list(counts or [])
+        self.total = sum(self.counts)
+        self.sum = 0
+        self.max = 0
+
+    def record(self, value):
+        value = int(value)
+        if value < 0:
+            value = 0
+        index = bucket_index(value)
+        counts = self.counts
+        if index >= len(counts):
+            counts.extend([0] * (index + 1 - len(counts)))
+        counts[index] += 1
+        self.total += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        if len(other.counts) > len(self.counts):
+            self.counts.extend([0] * (len(other.counts) - len(self.counts)))
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.total += other.total
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+        return self
+
+    def percentile(self, q):
+        """Value at quantile q (0..1): midpoint of the bucket that holds it."""
+        if not self.total:
+            return None
+        rank = q * self.total
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                low, high = bucket_bounds(index)
+                return min((low + high - 1) / 2, self.max)
+        return self.max
+
+    def mean(self):
+        return self.sum / self.total if self.total else None
+
+    def state(self):
+        """Picklable state for sending between processes."""
+        return {"counts": self.counts, "total": self.total, "sum": self.sum, "max": self.max}
+
+    @classmethod
+    def from_state(cls, state):
+        histogram = cls(state["counts"])
+        histogram.total, histogram.sum, histogram.max = state["total"], state["sum"], state["max"]
+        return histogram
+
+    def summary(self):
+        return {
+            "count": self.total,
+            "mean": self.mean(),
+            "p50": self.percentile(0.50),
+            "p90": self.percentile(0.90),
+            "p99": self.percentile(0.99),
+            "p99.9": self.percentile(0.999),
+            "max": self.max if self.total else None,
+        }
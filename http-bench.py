@@ -0,0 +1,201 @@
+"""HTTP load benchmark for the Flask apps.
+
+Closed loop: `--processes` x `--connections` keep-alive connections each
+send requests back to back for `--duration` seconds. Every `--request`
+("METHOD PATH [form body]") is benchmarked in turn. Throughput, errors and
+latency percentiles (histogram.py) are reported as JSON on stdout, or
+`--json FILE`, with a short table on stderr.
+
+`--app udp-client.py` first spawns a UDP backend and the app on local
+ports, so the benchmark runs on one machine. The app is started through
+serve.py once per `--servers` entry: "dev" (Werkzeug development server) and/or
+"production" (gunicorn, `--server-workers` x `--server-threads`). Otherwise
+`--base` points at a server that is already running.
+
+    python http-bench.py --app udp-client.py --servers dev production \\
+        --request "POST / action=sync" --request "GET /api/sync" --request "GET /api/sync?batch=8"
+"""
+import argparse
+import http.client
+import importlib.util
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+from histogram import LogHistogram
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_script(filename, name):
+    # Scripts with a dash in their name are loaded by path
+    spec = importlib.util.spec_from_file_location(name, os.path.join(HERE, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def parse_request(spec):
+    """'POST / action=sync' -> ('POST', '/', b'action=sync')"""
+    parts = spec.split(None, 2)
+    method, path = parts[0].upper(), parts[1]
+    body = parts[2].encode() if len(parts) > 2 else None
+    return method, path, body
+
+
+def wait_for_http(host, port, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"nothing listening on {host}:{port} after {timeout}s")
+
+
+def spawn_app(app, server, http_port, udp_port, workers, threads):
+    """Start a UDP backend (for udp-client.py) and `app` through serve.py."""
+    loadtest = load_script("udp-loadtest.py", "udp_loadtest")
+    backend = loadtest.spawn_backend("blocking", udp_port)
+    env = dict(os.environ, SERVER_IP=f"127.0.0.1:{udp_port}", FLASK_DEBUG="0")
+    command = [sys.executable, os.path.join(HERE, "serve.py"), app, "--host", "127.0.0.1", "--port", str(http_port)]
+    if server == "dev":
+        command.append("--dev")
+    else:
+        command += ["--workers", str(workers), "--threads", str(threads)]
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_for_http("127.0.0.1", http_port)
+    return [process, backend]
+
+
+def connection_loop(host, port, request, deadline, out):
+    method, path, body = request
+    headers = {"Content-Type": "application/x-www-form-urlencoded"} if body else {}
+    histogram = LogHistogram()
+    errors = 0
+    statuses = {}
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()  # reconnects on the next request
+            continue
+        histogram.record((time.perf_counter() - start) * 1_000_000)
+        statuses[response.status] = statuses.get(response.status, 0) + 1
+    conn.close()
+    out.append((histogram, errors, statuses))
+
+
+def driver(host, port, request, connections, duration, results):
+    deadline = time.perf_counter() + duration
+    out = []
+    threads = [threading.Thread(target=connection_loop, args=(host, port, request, deadline, out))
+               for _ in range(connections)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    histogram = LogHistogram()
+    errors = 0
+    statuses = {}
+    for part, part_errors, part_statuses in out:
+        histogram.merge(part)
+        errors += part_errors
+        for status, count in part_statuses.items():
+            statuses[status] = statuses.get(status, 0) + count
+    results.put({"histogram": histogram.state(), "errors": errors, "statuses": statuses})
+
+
+def run_load(host, port, request, args):
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(
+        target=driver, args=(host, port, request, args.connections, args.duration, results))
+        for _ in range(args.processes)]
+    for w in workers:
+        w.start()
+    parts = [results.get() for _ in workers]
+    for w in workers:
+        w.join()
+
+    histogram = LogHistogram()
+    statuses = {}
+    for part in parts:
+        histogram.merge(LogHistogram.from_state(part["histogram"]))
+        for status, count in part["statuses"].items():
+            statuses[str(status)] = statuses.get(str(status), 0) + count
+    return {
+        "requests": histogram.total,
+        "errors": sum(p["errors"] for p in parts),
+        "statuses": statuses,
+        "throughput_rps": histogram.total / args.duration,
+        "latency_us": histogram.summary(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP load benchmark for the Flask apps")
+    parser.add_argument("--request", action="append", dest="requests", metavar='"METHOD PATH [BODY]"',
+                        help="request to benchmark (repeatable; default GET /)")
+    parser.add_argument("--base", default="http://127.0.0.1:5001", help="server to benchmark")
+    parser.add_argument("--app", help="spawn this app (e.g. udp-client.py) with a local UDP backend")
+    parser.add_argument("--servers", nargs="+", choices=["dev", "production"], default=["production"],
+                        help="with --app: which server(s) to run it on, benchmarked in turn")
+    parser.add_argument("--server-workers", type=int, default=4, help="production server worker processes")
+    parser.add_argument("--server-threads", type=int, default=8, help="production server threads per worker")
+    parser.add_argument("--connections", type=int, default=8, help="keep-alive connections per process")
+    parser.add_argument("--processes", type=int, default=2, help="client processes")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per request type")
+    parser.add_argument("--json", metavar="FILE", help="write results here instead of stdout")
+    args = parser.parse_args()
+
+    free_port = load_script("udp-loadtest.py", "udp_loadtest").free_port
+    runs = []
+    for server in (args.servers if args.app else [None]):
+        spawned = []
+        if args.app:
+            host, port = "127.0.0.1", free_port()
+            spawned = spawn_app(args.app, server, port, free_port(), args.server_workers, args.server_threads)
+        else:
+            base = urllib.parse.urlsplit(args.base)
+            host, port = base.hostname, base.port or 80
+        try:
+            for spec in args.requests or ["GET /"]:
+                result = run_load(host, port, parse_request(spec), args)
+                runs.append(dict(server=server, request=spec, **result))
+                latency = result["latency_us"]
+                print(f"{server or f'{host}:{port}':<12} {spec:<32} {result['throughput_rps']:8.0f} req/s  "
+                      f"errors {result['errors']}  p50 {(latency['p50'] or 0) / 1000:.2f}ms  "
+                      f"p99 {(latency['p99'] or 0) / 1000:.2f}ms", file=sys.stderr)
+        finally:
+            for process in spawned:
+                process.terminate()
+                process.wait()
+
+    report = {
+        "config": {"app": args.app, "connections": args.connections, "processes": args.processes,
+                   "duration": args.duration, "server_workers": args.server_workers,
+                   "server_threads": args.server_threads},
+        "runs": runs,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""Counters and latency histograms, exported in the Prometheus text format.
+
+Shared by every service: the Flask apps serve `REGISTRY` on `/metrics`
+(see `install`), and the UDP backend answers a `STATS` datagram with it.
+
+Recording takes no lock. Each thread adds to its own shard, kept in a dict
+keyed by thread ident, and only that thread ever writes its shard. Reading
+a metric sums the shards. Histograms use the log-linear buckets of
+histogram.py (relative error below 1/32), stored in microseconds. They are
+exported as Prometheus histograms with the fixed `le` bounds in
+EXPORT_BOUNDS, in seconds.
+
+Each process (a gunicorn worker, a backend worker) has its own registry, so
+every series carries a `worker` label with the process ID. A scrape that
+lands on another worker then shows up as a different series rather than as
+a counter reset.
+
+    requests = REGISTRY.counter("app_requests_total", "Requests handled", {"path": "/"})
+    latency = REGISTRY.histogram("app_latency_seconds", "Time to answer")
+    requests.inc()
+    latency.observe(0.0031)
+"""
+import os
+import threading
+import time
+from threading import get_ident
+
+from histogram import SUB_BITS, SUB_BUCKETS, bucket_index
+
+# Enough log-linear buckets for microsecond values up to ~2^40 (12 days)
+BUCKETS = (40 - SUB_BITS + 1) << SUB_BITS
+# Prometheus `le` bounds (seconds) the histograms are exported with
+EXPORT_BOUNDS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Buckets below each index count towards the matching bound: everything up to
+# and including the bucket that holds the bound, so a cut is off by < 1/32
+_EXPORT_CUTS = tuple(bucket_index(round(bound * 1_000_000)) + 1 for bound in EXPORT_BOUNDS)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, labels):
+        self.labels = labels
+        self._shards = {}  # thread ident -> count
+
+    def inc(self, amount=1):
+        shards = self._shards
+        ident = get_ident()
+        try:
+            shards[ident] += amount
+        except KeyError:
+            shards[ident] = amount
+
+    def value(self):
+        # list() copies in one step, so a thread adding its first shard can't break the iteration
+        return sum(list(self._shards.values()))
+
+    def samples(self, name):
+        yield name, self.labels, self.value()
+
+
+class Histogram:
+    """Log-bucketed histogram of durations, observed in seconds."""
+    kind = "histogram"
+
+    def __init__(self, labels):
+        self.labels = labels
+        self._shards = {}  # thread ident -> [count per bucket..., sum in microseconds]
+
+    def observe(self, seconds):
+        shard = self._shards.get(get_ident())
+        if shard is None:
+            shard = self._shards[get_ident()] = [0] * (BUCKETS + 1)
+        value = int(seconds * 1_000_000)
+        if value < 2 * SUB_BUCKETS:
+            index = value if value > 0 else 0
+        else:
+            shift = value.bit_length() - SUB_BITS - 1
+            index = (shift << SUB_BITS) + (value >> shift)
+        shard[index] += 1
+        shard[BUCKETS] += value
+
+    def time(self):
+        """Context manager observing the duration of its block."""
+        return _Timer(self)
+
+    def merged(self):
+        counts = [0] * (BUCKETS + 1)
+        for shard in list(self._shards.values()):
+            for index, count in enumerate(shard):
+                if count:
+                    counts[index] += count
+        return counts
+
+    def samples(self, name):
+        counts = self.merged()
+        total = 0
+        previous = 0
+        for bound, cut in zip(EXPORT_BOUNDS, _EXPORT_CUTS):
+            total += sum(counts[previous:cut])
+            previous = cut
+            yield name + "_bucket", dict(self.labels, le=repr(bound)), total
+        total += sum(counts[previous:BUCKETS])
+        yield name + "_bucket", dict(self.labels, le="+Inf"), total
+        yield name + "_sum", self.labels, counts[BUCKETS] / 1_000_000
+        yield name + "_count", self.labels, total
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Callback:
+    """Value read from a function at scrape time (gauges, or counters kept elsewhere)."""
+
+    def __init__(self, labels, fn, kind):
+        self.labels = labels
+        self.fn = fn
+        self.kind = kind
+
+    def samples(self, name):
+        value = self.fn()
+        if isinstance(value, dict):  # {label value: number} for one extra label
+            key, values = value.get("label"), value.get("values", {})
+            for label, number in values.items():
+                yield name, dict(self.labels, **{key: label}), number
+        elif value is not None:
+            yield name, self.labels, value
+
+
+class Registry:
+    def __init__(self):
+        self._families = {}  # name -> (help, kind, {label tuple: metric})
+        self._lock = threading.Lock()  # only taken to create metrics, never to record
+
+    def _get(self, name, help, labels, factory):
+        labels = dict(labels or {})
+        key = tuple(sorted(labels.items()))
+        family = self._families.get(name)
+        if family is not None and key in family[2]:
+            return family[2][key]
+        with self._lock:
+            family = self._families.get(name)
+            metric = family[2].get(key) if family is not None else None
+            if metric is None:
+                metric = factory(labels)
+                if family is None:
+                    family = self._families[name] = (help, metric.kind, {})
+                family[2][key] = metric
+            return metric
+
+    def counter(self, name, help, labels=None):
+        return self._get(name, help, labels, Counter)
+
+    def histogram(self, name, help, labels=None):
+        return self._get(name, help, labels, Histogram)
+
+    def callback(self, name, help, fn, kind="gauge", labels=None):
+        """Register `fn()` -> number, or {"label": name, "values": {value: number}}."""
+        return self._get(name, help, labels, lambda labels: Callback(labels, fn, kind))
+
+    def render(self):
+        """The whole registry in the Prometheus text exposition format."""
+        worker = {"worker": str(os.getpid())}
+        lines = []
+        with self._lock:
+            families = sorted((name, help, kind, list(metrics.values()))
+                              for name, (help, kind, metrics) in self._families.items())
+        for name, help, kind, metrics in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for metric in metrics:
+                try:
+                    samples = list(metric.samples(name))
+                except Exception:
+                    continue  # a failing callback must not break the scrape
+                for sample_name, labels, value in samples:
+                    lines.append(f"{sample_name}{_format_labels(dict(labels, **worker))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def install(app, registry=REGISTRY):
+    """Serve `registry` on /metrics and count/time every request of a Flask app
+    (http_requests_total and http_request_duration_seconds, by endpoint)."""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _observe(response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            endpoint = request.endpoint or "unmatched"
+            registry.histogram("http_request_duration_seconds", "Time to produce the response (streamed bodies excluded)",
+                               {"endpoint": endpoint}).observe(time.perf_counter() - start)
+            registry.counter("http_requests_total", "HTTP requests by endpoint and status",
+                             {"endpoint": endpoint, "status": response.status_code}).inc()
+        return response
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(registry.render(), content_type=CONTENT_TYPE)
+
+    return registry
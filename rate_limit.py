@@ -0,0 +1,174 @@
+"""Per-source rate limiting for the UDP backend: token buckets in a fixed-size table.
+
+Each source IP address has a token bucket (`rate` tokens per second, up to
+`burst`). A packet costs one token. A packet that finds the bucket empty is
+dropped without any reply, so a flood gets nothing back to amplify.
+
+The buckets live in a `ClientTable`: parallel arrays (key hash, tokens,
+last refill time, CLOCK reference bit) with a fixed number of slots, so
+memory stays the same however many addresses show up. The table is
+set-associative. A source hashes to one set of `ways` slots and is looked up
+only there. When the set is full, CLOCK picks the victim: a per-set hand
+sweeps the slots, clearing reference bits, and evicts the first slot not
+used since its last pass. New entries start unreferenced, so a stream of
+one-off (e.g. spoofed) addresses recycles the same slots instead of pushing
+out regular clients. An evicted source comes back with a full bucket, so
+the table bounds memory, not what address churn can get through.
+
+A `Gate` applies two independent budgets: one for admin commands (ADMIN_*,
+STATS) and one for everything else. Admin commands can also be restricted
+to an allowlist of addresses/networks. Configuration (all off by default):
+
+    RATE_TIME=RATE[:BURST]      time requests (and garbage) per second per source
+    RATE_ADMIN=RATE[:BURST]     admin commands per second per source
+    ADMIN_ALLOW=127.0.0.1,10.0.0.0/8
+    RATE_TABLE_SIZE=65536       sources remembered per budget and worker
+
+STATS is answered only to ADMIN_ALLOW, or to loopback when no allowlist is
+set, even with rate limiting off: its reply is several KB for a 5-byte
+request, so open to everyone it would amplify spoofed traffic.
+
+Every worker has its own tables. With SO_REUSEPORT one source port always
+reaches the same worker, but a client spreading over ports may get up to
+one budget per worker.
+"""
+import array
+import ipaddress
+import os
+import time
+
+ADMIN_PREFIX = b"ADMIN_"
+STATS_COMMAND = b"STATS"
+
+
+class ClientTable:
+    def __init__(self, rate, burst, capacity=65536, ways=8):
+        self.rate = rate
+        self.burst = burst
+        self.ways = ways
+        sets = 1
+        while sets * ways < capacity:
+            sets *= 2
+        self.set_mask = sets - 1
+        slots = sets * ways
+        self.keys = array.array("q", bytes(8 * slots))      # hash of the source, 0 = empty
+        self.tokens = array.array("d", bytes(8 * slots))
+        self.stamps = array.array("d", bytes(8 * slots))    # monotonic time of the last refill
+        self.referenced = bytearray(slots)                  # CLOCK bit
+        self.hands = array.array("B", bytes(sets))          # CLOCK hand per set
+        self.size = 0
+        self.evictions = 0
+
+    @property
+    def capacity(self):
+        return len(self.keys)
+
+    def allow(self, source, now):
+        """Take one token from `source`'s bucket. False if it is empty."""
+        key = hash(source) or 1
+        base = (key & self.set_mask) * self.ways
+        keys = self.keys
+        slot = base
+        end = base + self.ways
+        while slot < end:
+            found = keys[slot]
+            if found == key:
+                self.referenced[slot] = 1
+                tokens = self.tokens[slot] + (now - self.stamps[slot]) * self.rate
+                if tokens > self.burst:
+                    tokens = self.burst
+                self.stamps[slot] = now
+                if tokens < 1.0:
+                    self.tokens[slot] = tokens
+                    return False
+                self.tokens[slot] = tokens - 1.0
+                return True
+            if found == 0:
+                self.size += 1  # sets fill front to back and never get holes
+                break
+            slot += 1
+        else:
+            slot = self._evict(base)
+        keys[slot] = key
+        self.tokens[slot] = self.burst - 1.0
+        self.stamps[slot] = now
+        return True
+
+    def _evict(self, base):
+        """CLOCK within one set: the first slot whose reference bit is clear."""
+        index = base // self.ways
+        hand = self.hands[index]
+        referenced = self.referenced
+        while True:
+            slot = base + hand
+            hand = (hand + 1) % self.ways
+            if referenced[slot]:
+                referenced[slot] = 0
+            else:
+                self.hands[index] = hand
+                self.evictions += 1
+                return slot
+
+    def stats(self):
+        return {"size": self.size, "capacity": self.capacity, "evictions": self.evictions}
+
+
+def parse_budget(text):
+    """'RATE[:BURST]' -> (rate, burst); the burst defaults to one second's worth."""
+    rate, _, burst = text.partition(":")
+    rate = float(rate)
+    return rate, float(burst) if burst else max(1.0, rate)
+
+
+def is_stats_allowed(gate, source):
+    """Whether to answer STATS from IP `source` (see above); `gate` may be None."""
+    if gate is not None and gate.admin_allow is not None:
+        return gate.is_admin_allowed(source)
+    try:
+        return ipaddress.ip_address(source).is_loopback
+    except ValueError:
+        return False
+
+
+class Gate:
+    def __init__(self, time_budget=None, admin_budget=None, admin_allow=None, table_size=65536):
+        self.time_table = ClientTable(*time_budget, capacity=table_size) if time_budget else None
+        self.admin_table = ClientTable(*admin_budget, capacity=table_size) if admin_budget else None
+        self.admin_allow = [ipaddress.ip_network(n, strict=False) for n in admin_allow] if admin_allow else None
+        self.throttled = {"time": 0, "admin": 0, "not_allowed": 0}
+
+    @classmethod
+    def from_env(cls):
+        """The configured Gate, or None when rate limiting is off."""
+        env = os.environ.get
+        time_budget = parse_budget(env("RATE_TIME")) if env("RATE_TIME") else None
+        admin_budget = parse_budget(env("RATE_ADMIN")) if env("RATE_ADMIN") else None
+        admin_allow = [n.strip() for n in env("ADMIN_ALLOW", "").split(",") if n.strip()]
+        if not (time_budget or admin_budget or admin_allow):
+            return None
+        return cls(time_budget, admin_budget, admin_allow, int(env("RATE_TABLE_SIZE", "65536")))
+
+    def is_admin_allowed(self, source):
+        if self.admin_allow is None:
+            return True
+        try:
+            address = ipaddress.ip_address(source)
+        except ValueError:
+            return False
+        return any(address in network for network in self.admin_allow)
+
+    def admit(self, data, nbytes, source):
+        """Whether to handle the datagram `data[:nbytes]` from IP `source`."""
+        # `data` may be a reused buffer: only its first `nbytes` are this datagram
+        if (nbytes >= len(ADMIN_PREFIX) and data.startswith(ADMIN_PREFIX)) or \
+                (nbytes == len(STATS_COMMAND) and data.startswith(STATS_COMMAND)):
+            if not self.is_admin_allowed(source):
+                self.throttled["not_allowed"] += 1
+                return False
+            table, budget = self.admin_table, "admin"
+        else:
+            table, budget = self.time_table, "time"
+        if table is None or table.allow(source, time.monotonic()):
+            return True
+        self.throttled[budget] += 1
+        return False
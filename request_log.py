@@ -0,0 +1,148 @@
+"""Asynchronous, sampled request logging for the UDP backend.
+
+The receive loop only calls `RequestLog.record(...)`, which counts the event
+and, if the record is sampled, appends a tuple to a bounded ring buffer. It
+never writes to stdout and never blocks: when the ring is full the record is
+dropped and counted. A background thread drains the ring in batches and
+writes all lines with one `write` call per batch.
+
+Once a second the writer looks at the request rate. Above
+`summary_threshold` requests/second the per-packet lines are replaced by
+one aggregate summary line per second, until the rate drops again.
+
+Configuration (environment):
+    LOG_SAMPLE             per-event sampling rates, e.g. "responded=0.1,invalid=0.01"
+    LOG_BUFFER             ring buffer capacity (records)
+    LOG_SUMMARY_THRESHOLD  requests/second above which summaries replace per-packet lines
+"""
+import os
+import sys
+import threading
+import time
+
+# Per-packet line formats, by event
+FORMATS = {
+    "responded": "Request from {address} -> Responded: {detail}",
+    "ignored": "Request from {address} -> IGNORED (Simulated Crash)",
+    "dropped": "Request from {address} -> DROPPED (Fault Injection)",
+    "invalid": "Request from {address} -> INVALID_REQUEST",
+    "admin": "{detail}",
+}
+# Events that are never sampled away or folded into summaries
+ALWAYS = frozenset(["admin"])
+
+
+def parse_sample_rates(spec):
+    """'responded=0.1,invalid=0' -> {'responded': 0.1, 'invalid': 0.0}"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        event, _, rate = item.partition("=")
+        rates[event.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class RequestLog:
+    def __init__(self, capacity=4096, sample_rates=None, summary_threshold=200,
+                 flush_interval=0.2, stream=None):
+        self.capacity = capacity
+        self.summary_threshold = summary_threshold
+        self.flush_interval = flush_interval
+        self.stream = stream or sys.stdout
+        # Keep 1 in `period` records of each event (0 = none)
+        self._periods = {event: (round(1 / rate) if rate > 0 else 0)
+                         for event, rate in (sample_rates or {}).items()}
+        self._seen = {}
+        # Single-producer / single-consumer ring: the receive loop only
+        # advances `_head`, the writer thread only advances `_tail`.
+        self._ring = [None] * capacity
+        self._head = 0
+        self._tail = 0
+        self.dropped = 0
+        # Monotonic per-event totals; the writer diffs snapshots every second
+        self.totals = {}
+        self.summarizing = False
+        self._stop = threading.Event()
+        self._thread = None
+        self.pid = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(capacity=int(os.getenv("LOG_BUFFER", "4096")),
+                   sample_rates=parse_sample_rates(os.getenv("LOG_SAMPLE", "")),
+                   summary_threshold=float(os.getenv("LOG_SUMMARY_THRESHOLD", "200")))
+
+    def start(self):
+        self.pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="request-log", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def record(self, event, address, detail=""):
+        """Called from the hot path. Never blocks."""
+        totals = self.totals
+        totals[event] = totals.get(event, 0) + 1
+        if event not in ALWAYS:
+            if self.summarizing:
+                return
+            period = self._periods.get(event, 1)
+            if period != 1:
+                seen = self._seen.get(event, 0) + 1
+                self._seen[event] = seen
+                if period == 0 or seen % period:
+                    return
+        if self._head - self._tail >= self.capacity:
+            self.dropped += 1
+            return
+        if not isinstance(detail, str):
+            detail = bytes(detail).decode(errors="replace")  # copy: callers reuse their buffers
+        self._ring[self._head % self.capacity] = (event, address, detail)
+        self._head += 1
+
+    def _drain(self):
+        head = self._head
+        if head == self._tail:
+            return
+        ring, capacity = self._ring, self.capacity
+        lines = []
+        for index in range(self._tail, head):
+            event, address, detail = ring[index % capacity]
+            ring[index % capacity] = None
+            lines.append(FORMATS.get(event, "{event} {address} {detail}").format(
+                event=event, address=address, detail=detail))
+        self._tail = head
+        self._write(lines)
+
+    def _summarize(self, previous, elapsed):
+        current = dict(self.totals)
+        deltas = {event: count - previous.get(event, 0) for event, count in current.items()}
+        rate = sum(count for event, count in deltas.items() if event not in ALWAYS) / elapsed
+        was_summarizing = self.summarizing
+        self.summarizing = rate > self.summary_threshold
+        if self.summarizing or was_summarizing:
+            parts = " ".join(f"{event}={count}" for event, count in sorted(deltas.items()) if count)
+            self._write([f"[summary] {rate:.0f} req/s over {elapsed:.1f}s: {parts or 'idle'} "
+                         f"(dropped log records: {self.dropped})"])
+        return current
+
+    def _write(self, lines):
+        try:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+        except (OSError, ValueError):
+            pass
+
+    def _run(self):
+        previous = dict(self.totals)
+        last_summary = time.monotonic()
+        while not self._stop.wait(self.flush_interval):
+            self._drain()
+            now = time.monotonic()
+            if now - last_summary >= 1.0:
+                previous = self._summarize(previous, now - last_summary)
+                last_summary = now
+        self._drain()
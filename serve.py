@@ -0,0 +1,112 @@
+"""Launcher for the Flask apps: webserver.py, udp-client.py and timeserver.py.
+
+By default an app runs under gunicorn: a master process pre-forks
+`--workers` worker processes. Each worker is threaded (gthread worker,
+`--threads` request threads) and keeps idle HTTP connections open for
+`--keepalive` seconds. Each worker imports the app itself after the fork,
+so per-process state (the UDP channel, caches, background threads) is
+created in the worker that uses it.
+
+The master handles the usual gunicorn signals:
+  * HUP:  graceful reload. New workers start with fresh code and config,
+          and old ones finish their requests first.
+  * TERM: graceful shutdown (what `docker stop` sends). Workers get
+          `--graceful-timeout` seconds to finish in-flight requests.
+  * TTIN / TTOU: add or remove one worker.
+
+`--dev` runs the Werkzeug development server instead. `--debug` (or
+FLASK_DEBUG=1) turns on the interactive debugger and reloader, which only
+exist there, so it implies `--dev`. Debug mode is never on by default.
+
+    python serve.py udp-client.py --port 5001 --workers 4 --threads 8
+    python serve.py webserver.py --port 5000 --dev --debug
+"""
+import argparse
+import importlib.util
+import os
+import sys
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:  # only needed for the production server
+    BaseApplication = object
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APPS = ("webserver.py", "udp-client.py", "timeserver.py")
+
+
+def load_app(script):
+    """Import the Flask `app` object from a script by path (udp-client.py
+    has a dash in its name, so it cannot be imported by module name)."""
+    name = os.path.splitext(os.path.basename(script))[0].replace("-", "_")
+    spec = importlib.util.spec_from_file_location(name, os.path.join(HERE, script))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module.app
+
+
+class ProductionServer(BaseApplication):
+    def __init__(self, script, options):
+        self.script = script
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return load_app(self.script)
+
+
+def parse_args():
+    env = os.environ.get
+    parser = argparse.ArgumentParser(description="Run one of the lab's Flask apps")
+    parser.add_argument("app", choices=APPS)
+    parser.add_argument("--host", default=env("WEB_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(env("WEB_PORT", "5000")))
+    parser.add_argument("--workers", type=int, default=int(env("WEB_WORKERS", str(min(4, 2 * (os.cpu_count() or 1))))),
+                        help="worker processes (WEB_WORKERS)")
+    parser.add_argument("--threads", type=int, default=int(env("WEB_THREADS", "8")),
+                        help="request threads per worker (WEB_THREADS)")
+    parser.add_argument("--keepalive", type=int, default=int(env("WEB_KEEPALIVE", "5")),
+                        help="seconds an idle keep-alive connection is kept open (WEB_KEEPALIVE)")
+    parser.add_argument("--graceful-timeout", type=int, default=int(env("WEB_GRACEFUL_TIMEOUT", "30")),
+                        help="seconds workers get to finish requests on reload/shutdown (WEB_GRACEFUL_TIMEOUT)")
+    parser.add_argument("--timeout", type=int, default=int(env("WEB_TIMEOUT", "60")),
+                        help="silent worker is restarted after this many seconds (WEB_TIMEOUT)")
+    parser.add_argument("--max-requests", type=int, default=int(env("WEB_MAX_REQUESTS", "0")),
+                        help="recycle a worker after this many requests, 0 = never (WEB_MAX_REQUESTS)")
+    parser.add_argument("--access-log", action="store_true", default=env("WEB_ACCESS_LOG") == "1",
+                        help="log every request to stdout (WEB_ACCESS_LOG=1)")
+    parser.add_argument("--dev", action="store_true", help="use the Werkzeug development server")
+    parser.add_argument("--debug", action="store_true", default=env("FLASK_DEBUG") == "1",
+                        help="debugger and reloader (FLASK_DEBUG=1); implies --dev")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.dev or args.debug:
+        load_app(args.app).run(host=args.host, port=args.port, debug=args.debug, threaded=True)
+        return
+    if BaseApplication is object:
+        sys.exit("gunicorn is not installed (pip install -r requirements.txt), or use --dev")
+    ProductionServer(args.app, {
+        "bind": f"{args.host}:{args.port}",
+        "worker_class": "gthread",
+        "workers": args.workers,
+        "threads": args.threads,
+        "keepalive": args.keepalive,
+        "graceful_timeout": args.graceful_timeout,
+        "timeout": args.timeout,
+        "max_requests": args.max_requests,
+        "max_requests_jitter": args.max_requests // 10,
+        "accesslog": "-" if args.access_log else None,
+        "proc_name": f"lab-{os.path.splitext(args.app)[0]}",
+    }).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Single-flight: concurrent callers asking for the same thing share one call.
+
+The first caller for a key (the leader) runs the function. Callers that
+arrive while that call is still in flight, and within `window` seconds of
+its start, become followers. They do not call again; they wait for the
+leader's result, or its exception. A caller arriving after the call
+finished, or later than `window` after it started, leads a new call. A
+shared result is therefore never older than the window plus one call.
+
+    flights = SingleFlight(window=0.01)
+    sample, coalesced = flights.do("sync", lambda: sync_time([]))
+
+`leaders` and `followers` count the two roles. followers / (leaders +
+followers) is the fraction of callers that were coalesced. A window of 0
+turns coalescing off: every caller leads.
+"""
+import threading
+import time
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    def __init__(self, window):
+        self.window = window
+        self._flights = {}  # key -> (monotonic start, Future)
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key, fn):
+        """Run (or join) the call for `key`. Returns (result, coalesced)."""
+        now = time.monotonic()
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and now - flight[0] <= self.window:
+                self.followers += 1
+                future = flight[1]
+            else:
+                self.leaders += 1
+                future = None
+                if self.window > 0:
+                    flight = self._flights[key] = (now, Future())
+        if future is not None:
+            return future.result(), True
+        if self.window <= 0:
+            return fn(), False
+        try:
+            result = fn()
+        except BaseException as e:
+            self._land(key, flight)
+            flight[1].set_exception(e)
+            raise
+        self._land(key, flight)
+        flight[1].set_result(result)
+        return result, False
+
+    def _land(self, key, flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def ratio(self):
+        """Fraction of callers so far that shared another caller's call."""
+        total = self.leaders + self.followers
+        return self.followers / total if total else 0.0
+
+    def stats(self):
+        return {"leaders": self.leaders, "followers": self.followers, "ratio": self.ratio()}
@@ -1,12 +1,39 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, request
 from datetime import datetime
+import gzip
+import hashlib
+import html
+import json
+import os
+import re
 import socket
 
+import metrics
+from event_stream import Ticker
+
+try:
+    import brotli
+except ImportError:  # optional: without it the CSS is served gzip-compressed only
+    brotli = None
+
 app = Flask(__name__)
+metrics.install(app)
+
+# Host identity does not change while we run: resolve it once, not per request
+HOSTNAME = socket.gethostname()
+try:
+    IP_ADDRESS = socket.gethostbyname(HOSTNAME)
+except socket.gaierror:
+    IP_ADDRESS = "unknown"
+
+# Live clock stream: shared tick resolution, and per-client bounds
+STREAM_TICK = float(os.getenv("STREAM_TICK", "0.1"))
+STREAM_QUEUE = int(os.getenv("STREAM_QUEUE", "8"))
+STREAM_DROP_AFTER = float(os.getenv("STREAM_DROP_AFTER", "30"))
+STREAM_KEEPALIVE = 15.0
 
 # --- STYLING & TEMPLATES ---
 STYLE = """
-<style>
     :root { --primary: #6c5ce7; --secondary: #a29bfe; --dark: #2d3436; --light: #dfe6e9; --success: #00b894; --code-bg: #282c34; }
     body { font-family: 'Segoe UI', Roboto, Helvetica, Arial, sans-serif; background-color: #f4f7f6; color: var(--dark); margin: 0; padding: 20px; display: flex; justify-content: center; min-height: 100vh; }
     .container { width: 100%; max-width: 600px; margin-top: 40px; }
@@ -44,15 +71,65 @@ STYLE = """
     /* Metadata Footer */
     .footer-info { margin-top: 30px; padding-top: 15px; border-top: 1px dashed #dfe6e9; font-size: 0.85rem; color: #b2bec3; text-align: left; }
     .footer-item { display: flex; justify-content: space-between; margin-bottom: 5px; }
-</style>
 """
 
-@app.route("/", methods=["GET"])
-def home():
-    return f"""
+
+class StaticAsset:
+    """A file kept in memory in every encoding we serve (identity, gzip and,
+    when the brotli module is installed, br), each with its own ETag."""
+
+    def __init__(self, data, content_type):
+        self.content_type = content_type
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        self.version = digest
+        self.variants = {None: (data, f'"{digest}"')}
+        self.variants["gzip"] = (gzip.compress(data, 9, mtime=0), f'"{digest}-gz"')
+        if brotli is not None:
+            self.variants["br"] = (brotli.compress(data), f'"{digest}-br"')
+
+    def response(self):
+        accepted = request.accept_encodings
+        encoding = next((e for e in ("br", "gzip") if e in self.variants and accepted[e]), None)
+        data, etag = self.variants[encoding]
+        if etag in request.headers.get("If-None-Match", ""):
+            response = Response(status=304)
+        else:
+            response = Response(data, content_type=self.content_type)
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+        response.headers["ETag"] = etag
+        response.headers["Vary"] = "Accept-Encoding"
+        # The URL carries the content hash (?v=...), so it can be cached for good
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+
+class Shell:
+    """A page rendered once with @field@ markers. fill() only joins the
+    precomputed static pieces with the per-request values."""
+
+    def __init__(self, text):
+        pieces = re.split(r"@(\w+)@", text)
+        self.head = pieces[0]
+        self.rest = list(zip(pieces[1::2], pieces[2::2]))
+
+    def fill(self, **values):
+        out = [self.head]
+        for name, text in self.rest:
+            out.append(values[name])
+            out.append(text)
+        return "".join(out)
+
+
+ASSETS = {"style.css": StaticAsset(STYLE.encode(), "text/css; charset=utf-8")}
+STYLESHEET = f'<link rel="stylesheet" href="/assets/style.css?v={ASSETS["style.css"].version}">'
+HOST = html.escape(HOSTNAME)
+
+# Every page is rendered once at startup; only the time fields change per request
+HOME_PAGE = f"""
     <!DOCTYPE html>
     <html>
-    <head><title>Web API Demo</title>{STYLE}</head>
+    <head><title>Web API Demo</title>{STYLESHEET}</head>
     <body>
         <div class="container">
             <div class="card">
@@ -87,32 +164,18 @@ def home():
     </html>
     """
 
-@app.route("/time", methods=["GET"])
-def get_time():
-    fmt = request.args.get("format", "html")
-    now = datetime.now()
-    hostname = socket.gethostname()
-    ip_addr = socket.gethostbyname(hostname)
+# The JSON document itself (Accept: application/json, e.g. curl or scripts)
+JSON_DOCUMENT = Shell(
+    '{"timestamp": "@timestamp@", "unix_epoch": @unix_epoch@, '
+    f'"server_info": {{"container_id": {json.dumps(HOSTNAME)}, "ip_address": {json.dumps(IP_ADDRESS)}}}, '
+    '"status": "active"}'
+)
 
-    # ---------------- ROBOT INTERFACE (JSON) ----------------
-    if fmt == "json":
-        # We manually construct the response to ensure the browser displays it comfortably 
-        # normally we would just return jsonify(data)
-        
-        json_str = f'''{{
-    <span class="key">"timestamp"</span>: <span class="string">"{now.isoformat()}"</span>,
-    <span class="key">"unix_epoch"</span>: <span class="number">{now.timestamp()}</span>,
-    <span class="key">"server_info"</span>: {{
-        <span class="key">"container_id"</span>: <span class="string">"{hostname}"</span>,
-        <span class="key">"ip_address"</span>: <span class="string">"{ip_addr}"</span>
-    }},
-    <span class="key">"status"</span>: <span class="string">"active"</span>
-}}'''
-        
-        return f"""
+# The same document, highlighted for a browser
+JSON_VIEW = Shell(f"""
         <!DOCTYPE html>
         <html>
-        <head><title>JSON Response</title>{STYLE}</head>
+        <head><title>JSON Response</title>{STYLESHEET}</head>
         <body>
             <div class="container">
                 <div class="card">
@@ -123,11 +186,20 @@ def get_time():
                     
                     <div class="code-block">
                         <div class="meta-tag">application/json</div>
-                        <pre>{json_str}</pre>
+                        <pre>{{
+    <span class="key">"timestamp"</span>: <span class="string">"@timestamp@"</span>,
+    <span class="key">"unix_epoch"</span>: <span class="number">@unix_epoch@</span>,
+    <span class="key">"server_info"</span>: {{
+        <span class="key">"container_id"</span>: <span class="string">"{HOST}"</span>,
+        <span class="key">"ip_address"</span>: <span class="string">"{IP_ADDRESS}"</span>
+    }},
+    <span class="key">"status"</span>: <span class="string">"active"</span>
+}}</pre>
                     </div>
 
                     <div class="footer-info">
                         <p><strong>Educational Note:</strong> This raw text is lightweight and easy for other programs to parse. It is not meant for humans to read directly.</p>
+                        <p>Programs asking with <code>Accept: application/json</code> get just the JSON document.</p>
                     </div>
 
                     <a href="/" class="btn btn-back">⬅ Back to Playground</a>
@@ -135,13 +207,12 @@ def get_time():
             </div>
         </body>
         </html>
-        """
+        """)
 
-    # ---------------- HUMAN INTERFACE (HTML) ----------------
-    return f"""
+TIME_PAGE = Shell(f"""
     <!DOCTYPE html>
     <html>
-    <head><title>Current Time</title>{STYLE}</head>
+    <head><title>Current Time</title>{STYLESHEET}</head>
     <body>
         <div class="container">
             <div class="card">
@@ -150,11 +221,11 @@ def get_time():
                     <span class="path">/time?format=html</span>
                 </div>
 
-                <div class="date-display">{now.strftime('%A, %B %d, %Y')}</div>
-                <div class="clock-display">{now.strftime('%H:%M:%S')}</div>
+                <div class="date-display">@date@</div>
+                <div class="clock-display">@clock@</div>
                 
                 <div style="background: #eef2f5; padding: 10px; border-radius: 8px; display: inline-block;">
-                    <span style="color: #636e72; font-size: 0.9em;">Served by Container: <strong>{hostname}</strong></span>
+                    <span style="color: #636e72; font-size: 0.9em;">Served by Container: <strong>{HOST}</strong></span>
                 </div>
 
                 <div class="footer-info">
@@ -164,9 +235,89 @@ def get_time():
                 <a href="/" class="btn btn-back">⬅ Back to Playground</a>
             </div>
         </div>
+        <script>
+            // Live clock: one Server-Sent Events stream instead of polling /time
+            if (window.EventSource) {{
+                const stream = new EventSource("/time/stream?interval=1");
+                stream.onmessage = (event) => {{
+                    const tick = JSON.parse(event.data);
+                    document.querySelector(".date-display").textContent = tick.date;
+                    document.querySelector(".clock-display").textContent = tick.clock;
+                }};
+            }}
+        </script>
     </body>
     </html>
-    """
+    """)
+
+def time_frame(number):
+    """One SSE frame per tick, serialized once for every subscriber."""
+    now = datetime.now()
+    data = json.dumps({"timestamp": now.isoformat(), "unix_epoch": now.timestamp(),
+                       "date": now.strftime('%A, %B %d, %Y'), "clock": now.strftime('%H:%M:%S')},
+                      separators=(",", ":"))
+    return f"id: {number}\ndata: {data}\n\n".encode()
+
+TICKER = Ticker(time_frame, tick=STREAM_TICK, queue_size=STREAM_QUEUE, drop_after=STREAM_DROP_AFTER)
+metrics.REGISTRY.callback("timeserver_stream_subscribers", "Open /time/stream connections", TICKER.subscriber_count)
+metrics.REGISTRY.callback("timeserver_stream_dropped_total", "Streams dropped for not reading",
+                          lambda: TICKER.dropped, kind="counter")
+
+@app.route("/", methods=["GET"])
+def home():
+    return HOME_PAGE
+
+@app.route("/assets/<name>", methods=["GET"])
+def asset(name):
+    if name not in ASSETS:
+        return Response("Not found", status=404)
+    return ASSETS[name].response()
+
+@app.route("/time", methods=["GET"])
+def get_time():
+    # Content negotiation: browsers rank text/html first, programs (curl's */*,
+    # or Accept: application/json) get JSON. ?format= picks the view in a browser.
+    wants_json = request.accept_mimetypes.best_match(["application/json", "text/html"]) == "application/json"
+    fmt = request.args.get("format", "json" if wants_json else "html")
+    now = datetime.now()
+
+    # ---------------- ROBOT INTERFACE (JSON) ----------------
+    if fmt == "json":
+        fields = {"timestamp": now.isoformat(), "unix_epoch": repr(now.timestamp())}
+        if wants_json:
+            response = Response(JSON_DOCUMENT.fill(**fields), mimetype="application/json")
+        else:
+            response = Response(JSON_VIEW.fill(**fields), mimetype="text/html")
+
+    # ---------------- HUMAN INTERFACE (HTML) ----------------
+    else:
+        response = Response(TIME_PAGE.fill(date=now.strftime('%A, %B %d, %Y'), clock=now.strftime('%H:%M:%S')),
+                            mimetype="text/html")
+    response.headers["Vary"] = "Accept"
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+@app.route("/time/stream", methods=["GET"])
+def time_stream():
+    """Server-Sent Events: a tick every ?interval= seconds (default 1), all
+    clients fed from the one shared TICKER."""
+    interval = min(60.0, max(STREAM_TICK, request.args.get("interval", 1.0, type=float)))
+    subscriber = TICKER.subscribe(interval)
+
+    def events():
+        try:
+            yield b"retry: 2000\n\n"
+            while True:
+                frames = subscriber.next_frames(STREAM_KEEPALIVE)
+                if frames is None:  # dropped for falling behind
+                    return
+                yield b"".join(frames) if frames else b": keep-alive\n\n"
+        finally:
+            TICKER.unsubscribe(subscriber)
+
+    return Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"})
 
 if __name__ == "__main__":
-    app.run(debug=True, host="0.0.0.0", port=5000)
\ No newline at end of file
+    # Development server; production runs through serve.py
+    app.run(debug=os.getenv("FLASK_DEBUG") == "1", host="0.0.0.0", port=5000)
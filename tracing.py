@@ -0,0 +1,206 @@
+"""Per-request tracing for udp-client.py: spans, Server-Timing and a trace store.
+
+A `Trace` is started for each traced HTTP request (see `install`) and bound
+to the handling thread, so code anywhere below the view can time a step
+without being handed the trace:
+
+    with tracing.span("send"):
+        sock.sendto(...)
+
+`span` does nothing when the thread has no trace (health probes, the clock
+synchronizer). Spans are timed with `time.perf_counter_ns` and kept as
+(name, start, duration) in nanoseconds from the start of the trace. A
+duration measured elsewhere, such as the backend's t3 - t2, is added with
+`Trace.add` and has no start.
+
+Each trace has a random 64-bit ID. The binary protocol (version 2) carries
+it to the backend, which echoes it and writes it in its request log.
+
+When the request ends, the spans are summed by name into a `Server-Timing`
+response header (durations in ms, the trace ID in the `trace` entry's
+description), and the trace goes to a `TraceStore`. The store keeps the
+most recent traces and, separately, the slowest ones seen so far. Those
+survive however much fast traffic follows, for tail-latency analysis.
+
+    TRACE_RECENT=200     recent traces kept
+    TRACE_SLOWEST=20     slowest traces kept
+"""
+import collections
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+
+_local = threading.local()
+
+
+class Trace:
+    def __init__(self, name):
+        self.name = name
+        self.trace_id = random.getrandbits(64) or 1  # 0 means "not traced" on the wire
+        self.started_at = time.time()
+        self.start_ns = time.perf_counter_ns()
+        self.duration_ns = None
+        self.spans = []  # (name, start ns from the trace start or None, duration ns)
+        self.notes = {}
+
+    def span(self, name):
+        return _Span(self, name)
+
+    def add(self, name, duration_ns, start_ns=None):
+        """A span measured elsewhere (start in perf_counter_ns, if known)."""
+        self.spans.append((name, None if start_ns is None else start_ns - self.start_ns, duration_ns))
+
+    def mark(self, name):
+        """A span from the start of the trace until now."""
+        self.add(name, time.perf_counter_ns() - self.start_ns, self.start_ns)
+
+    def note(self, **notes):
+        self.notes.update(notes)
+
+    def finish(self):
+        self.duration_ns = time.perf_counter_ns() - self.start_ns
+        return self
+
+    def totals(self):
+        """Duration per span name, summed, in order of first appearance."""
+        totals = {}
+        for name, _, duration in self.spans:
+            totals[name] = totals.get(name, 0) + duration
+        return totals
+
+    def server_timing(self):
+        entries = [f"{name};dur={duration / 1e6:.3f}" for name, duration in self.totals().items()]
+        if self.duration_ns is not None:
+            entries.append(f"total;dur={self.duration_ns / 1e6:.3f}")
+        entries.append(f'trace;desc="{self.trace_id:016x}"')
+        return ", ".join(entries)
+
+    def to_dict(self):
+        return {"trace_id": f"{self.trace_id:016x}", "name": self.name, "started_at": self.started_at,
+                "duration_ms": None if self.duration_ns is None else self.duration_ns / 1e6,
+                "spans": [{"name": name, "start_ms": None if start is None else start / 1e6,
+                           "duration_ms": duration / 1e6} for name, start, duration in self.spans],
+                "notes": self.notes}
+
+
+class _Span:
+    __slots__ = ("trace", "name", "start")
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        self.trace.spans.append((self.name, self.start - self.trace.start_ns, end - self.start))
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def current():
+    """The trace bound to this thread, or None."""
+    return getattr(_local, "trace", None)
+
+
+def span(name):
+    """Context manager timing its block as a span of the current trace, if any."""
+    trace = getattr(_local, "trace", None)
+    return _NO_SPAN if trace is None else _Span(trace, name)
+
+
+def begin(name):
+    trace = _local.trace = Trace(name)
+    return trace
+
+
+def end():
+    """Unbind and finish the current trace. Returns it, or None."""
+    trace = getattr(_local, "trace", None)
+    _local.trace = None
+    return trace.finish() if trace is not None else None
+
+
+class TraceStore:
+    """The `recent` latest traces, plus the `slowest` ones ever seen (a min-heap
+    on duration, so a new trace only displaces the fastest of them)."""
+
+    def __init__(self, recent=200, slowest=20):
+        self._recent = collections.deque(maxlen=recent)
+        self._slowest = []  # (duration ns, sequence, Trace)
+        self.slowest_size = slowest
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self.recorded = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(recent=int(os.getenv("TRACE_RECENT", "200")), slowest=int(os.getenv("TRACE_SLOWEST", "20")))
+
+    def add(self, trace):
+        entry = (trace.duration_ns, next(self._sequence), trace)
+        with self._lock:
+            self.recorded += 1
+            self._recent.append(trace)
+            if len(self._slowest) < self.slowest_size:
+                heapq.heappush(self._slowest, entry)
+            elif self._slowest and entry[0] > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    def recent(self):
+        """Newest first."""
+        with self._lock:
+            return list(reversed(self._recent))
+
+    def slowest(self):
+        """Slowest first."""
+        with self._lock:
+            return [trace for _, _, trace in sorted(self._slowest, reverse=True)]
+
+    def find(self, trace_id):
+        with self._lock:
+            candidates = list(self._recent) + [trace for _, _, trace in self._slowest]
+        return next((trace for trace in candidates if trace.trace_id == trace_id), None)
+
+
+def install(app, store, endpoints):
+    """Trace the Flask views named in `endpoints`: a trace per request, the
+    Server-Timing header on the response, and the finished trace in `store`."""
+    from flask import request
+
+    @app.before_request
+    def _begin_trace():
+        if request.endpoint in endpoints:
+            begin(request.endpoint)
+
+    @app.after_request
+    def _end_trace(response):
+        trace = end()
+        if trace is not None:
+            trace.note(status=response.status_code)
+            response.headers["Server-Timing"] = trace.server_timing()
+            store.add(trace)
+        return response
+
+    @app.teardown_request
+    def _drop_trace(exc):
+        _local.trace = None  # the view raised: after_request did not run
+
+    return store
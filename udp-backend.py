@@ -1,45 +1,652 @@
+import argparse
+import asyncio
+import itertools
+import multiprocessing
+import os
+import signal
 import socket
+import struct
+import sys
+import time
 from datetime import datetime
-import os
+
+import fault_injection
+import rate_limit
+import request_log
+import udp_protocol
+from metrics import REGISTRY
+
+try:
+    import uvloop  # optional: faster event loop for the asyncio engine
+except ImportError:
+    uvloop = None
 
 # Configuration
 IPaddress = "0.0.0.0"
 portNumber = 5678
 bufferSize = 1024
 
-# STATE VARIABLE: Controls if the server is "Simulating a Crash"
-is_server_healthy = True
-
-UDPServerSocket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
-UDPServerSocket.bind((IPaddress, portNumber))
-
-print(f"UDP Time Server running on {IPaddress}:{portNumber}")
-print("Waiting for requests...")
-
-while True:
-    message, clientAddress = UDPServerSocket.recvfrom(bufferSize)
-    decoded_message = message.decode()
-
-    # --- ADMIN COMMANDS (To simulate failures) ---
-    if decoded_message == "ADMIN_CRASH":
-        is_server_healthy = False
-        print(f"[ADMIN] Simulation Mode: CRASHED (Ignoring requests from {clientAddress})")
-        # We don't reply, just acknowledge in logs
-        
-    elif decoded_message == "ADMIN_REPAIR":
-        is_server_healthy = True
-        print(f"[ADMIN] Simulation Mode: REPAIRED (Resuming normal service)")
-
-    # --- STANDARD CLIENT REQUESTS ---
-    elif decoded_message == "REQUEST_TIME":
-        if is_server_healthy:
-            # Normal behavior: Send time
-            current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
-            print(f"Request from {clientAddress} -> Responded: {current_time}")
-            UDPServerSocket.sendto(current_time.encode(), clientAddress)
+# Number of worker processes sharing the port (1 = classic single loop)
+NUM_WORKERS = int(os.getenv("UDP_WORKERS", "1"))
+# How often the supervisor checks for dead workers
+SUPERVISOR_INTERVAL = 0.5
+# Restart backoff for a worker slot whose worker keeps dying at startup: doubles
+# per quick exit up to the cap, and resets once a worker stays up long enough
+RESTART_BACKOFF_MAX = 30.0
+RESTART_BACKOFF_RESET = 10.0
+# Request engine: "blocking" (recvfrom loop) or "asyncio" (DatagramProtocol)
+ENGINE = os.getenv("UDP_ENGINE", "blocking")
+# Seconds between the asyncio engine's periodic stats line
+STATS_INTERVAL = float(os.getenv("STATS_INTERVAL", "10"))
+
+# Commands are matched on the raw bytes, without decoding
+CMD_REQUEST_TIME = b"REQUEST_TIME"
+CMD_ADMIN_CRASH = b"ADMIN_CRASH"
+CMD_ADMIN_REPAIR = b"ADMIN_REPAIR"
+CMD_STATS = b"STATS"  # answered with this worker's metrics (Prometheus text)
+CMD_ADMIN_FAULT = b"ADMIN_FAULT"  # + settings, see fault_injection.py
+REPLY_INVALID = b"INVALID_REQUEST"
+# Binary requests start with this magic (see udp_protocol.py)
+BINARY_MAGIC = udp_protocol.MAGIC
+CMD_HELLO = udp_protocol.HELLO
+
+# Kernel receive timestamps (Linux SO_TIMESTAMPNS, blocking engine): binary
+# replies then carry the time the datagram reached the socket as t2, instead
+# of the time Python got round to it. Older Pythons do not export the
+# option; 35 is its value on most Linux architectures. Elsewhere it is None
+# and kernel timestamps are off.
+KERNEL_TIMESTAMPS = os.getenv("KERNEL_TIMESTAMPS", "1") == "1"
+SO_TIMESTAMPNS = getattr(socket, "SO_TIMESTAMPNS", 35 if sys.platform.startswith("linux") else None)
+SCM_TIMESTAMPNS = getattr(socket, "SCM_TIMESTAMPNS", SO_TIMESTAMPNS)
+TIMESPEC = struct.Struct("@ll")  # struct timespec: tv_sec, tv_nsec
+# No CMSG_SPACE (e.g. Windows): no ancillary data, receive times are taken in user space
+ANCILLARY_SIZE = socket.CMSG_SPACE(TIMESPEC.size) if hasattr(socket, "CMSG_SPACE") else 0
+
+# Log requests (the classic lab output). Disable for load tests. Sampling and
+# per-second summaries are configured in request_log.py (LOG_SAMPLE, ...).
+LOG_REQUESTS = os.getenv("LOG_REQUESTS", "1") == "1"
+
+
+# Per-worker counters (metrics.py), reported by the STATS command
+REQUESTS = {"text": REGISTRY.counter("udp_backend_requests_total", "Time requests received", {"protocol": "text"}),
+            "binary": REGISTRY.counter("udp_backend_requests_total", "Time requests received", {"protocol": "binary"})}
+REPLIES = {"text": REGISTRY.counter("udp_backend_replies_total", "Time replies sent", {"protocol": "text"}),
+           "binary": REGISTRY.counter("udp_backend_replies_total", "Time replies sent", {"protocol": "binary"})}
+QUEUEING = REGISTRY.histogram("udp_backend_queueing_seconds",
+                              "Kernel receive timestamp to user-space handling (blocking engine with KERNEL_TIMESTAMPS)")
+IGNORED = REGISTRY.counter("udp_backend_ignored_total", "Time requests ignored while in simulated crash")
+INVALID = REGISTRY.counter("udp_backend_invalid_total", "Datagrams answered with INVALID_REQUEST")
+ADMIN = {command: REGISTRY.counter("udp_backend_admin_total", "Admin commands received", {"command": command})
+         for command in ("crash", "repair", "stats", "fault")}
+
+
+def stats_reply(is_server_healthy):
+    REGISTRY.callback("udp_backend_healthy", "1 unless in simulated crash (shared by all workers)",
+                      lambda: int(is_server_healthy.value))
+    return REGISTRY.render().encode()
+
+
+def fault_injector(faults, send):
+    """This worker's FaultInjector (None without shared fault settings), with its metrics."""
+    if faults is None:
+        return None
+    injector = fault_injection.FaultInjector(faults, send)
+    REGISTRY.callback("udp_backend_faults_total", "Time replies dropped, delayed, duplicated or reordered by fault injection",
+                      lambda: {"label": "action", "values": injector.counts}, kind="counter")
+    REGISTRY.callback("udp_backend_fault_pending", "Delayed replies waiting on the timer wheel",
+                      lambda: injector.pending)
+    return injector
+
+
+def enable_kernel_timestamps(UDPServerSocket):
+    """Ask the kernel to timestamp every received datagram. False where
+    SO_TIMESTAMPNS does not exist (non-Linux)."""
+    if SO_TIMESTAMPNS is None:
+        return False
+    try:
+        UDPServerSocket.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+    except OSError:
+        return False
+    return True
+
+
+def get_gate():
+    """This worker's rate limiting Gate (rate_limit.py), or None when it is off."""
+    gate = rate_limit.Gate.from_env()
+    if gate is not None:
+        REGISTRY.callback("udp_backend_throttled_total", "Datagrams dropped by rate limiting, by reason",
+                          lambda: {"label": "reason", "values": gate.throttled}, kind="counter")
+        tables = {"time": gate.time_table, "admin": gate.admin_table}
+        REGISTRY.callback("udp_backend_rate_table_sources", "Sources tracked per rate limit budget",
+                          lambda: {"label": "budget", "values": {k: t.size for k, t in tables.items() if t}})
+        REGISTRY.callback("udp_backend_rate_table_evictions_total", "Sources evicted from a full rate limit table",
+                          lambda: {"label": "budget", "values": {k: t.evictions for k, t in tables.items() if t}},
+                          kind="counter")
+    return gate
+
+
+def admin_fault(faults, argument, clientAddress, record):
+    """Apply an ADMIN_FAULT command. Returns False if it is malformed."""
+    try:
+        settings = fault_injection.parse_command(argument.decode())
+    except (ValueError, UnicodeDecodeError):
+        return False
+    fault_injection.apply(faults, settings)
+    record("admin", clientAddress, f"[ADMIN] Fault injection: {fault_injection.describe(faults)}")
+    return True
+
+
+def create_socket(reuse_port, port=portNumber):
+    """Bind the UDP socket. With SO_REUSEPORT every worker binds the same port
+    and the kernel spreads incoming datagrams across them."""
+    UDPServerSocket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+    if reuse_port:
+        UDPServerSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    UDPServerSocket.bind((IPaddress, port))
+    return UDPServerSocket
+
+
+_request_log = None
+
+
+def get_request_log():
+    """The process' background request logger (each worker starts its own)."""
+    global _request_log
+    if _request_log is None or _request_log.pid != os.getpid():
+        _request_log = request_log.RequestLog.from_env().start()
+    return _request_log
+
+
+def close_request_log():
+    """Flush and stop this process' request logger, if it started one. Called
+    on shutdown: the writer is a daemon thread, so records still in its ring
+    (admin events included) would otherwise be lost."""
+    if _request_log is not None and _request_log.pid == os.getpid():
+        _request_log.close()
+
+
+def binary_detail(request, nbytes):
+    """Request log detail for a binary request: its trace ID, if it has one,
+    so a client trace (tracing.py) can be found in the backend's log."""
+    trace_id = udp_protocol.trace_id_of(request, nbytes)
+    return f"(binary trace={trace_id:016x})" if trace_id else "(binary)"
+
+
+class TimestampFormatter:
+    """Renders '%Y-%m-%d %H:%M:%S.%f' into one reusable 26-byte buffer.
+
+    The date/second prefix is only re-rendered when the second changes;
+    for every other packet just the six microsecond digits are spliced in.
+    """
+    SIZE = 26
+    PREFIX_SIZE = 20  # 'YYYY-MM-DD HH:MM:SS.'
+    _DIGITS = [b"%03d" % i for i in range(1000)]
+
+    def __init__(self):
+        self.buffer = bytearray(self.SIZE)
+        self._second = None
+
+    def stamp(self, ns=None):
+        if ns is None:
+            ns = time.time_ns()
+        second, remainder = divmod(ns, 1_000_000_000)
+        if second != self._second:
+            self._second = second
+            self.buffer[:self.PREFIX_SIZE] = datetime.fromtimestamp(second).strftime('%Y-%m-%d %H:%M:%S.').encode()
+        micros = remainder // 1000
+        self.buffer[20:23] = self._DIGITS[micros // 1000]
+        self.buffer[23:26] = self._DIGITS[micros % 1000]
+        return self.buffer
+
+
+def serve(UDPServerSocket, is_server_healthy, limit=None, faults=None):
+    """Main request loop.
+
+    STATE VARIABLE: `is_server_healthy` controls if the server is "Simulating a Crash".
+    It is a shared-memory flag, so an ADMIN command received by one worker is
+    seen by all the others. `faults` (fault_injection.shared_config()) holds
+    the shared ADMIN_FAULT settings in the same way. Time replies go through
+    the fault injector while any fault is set. While delayed replies are
+    pending, the socket wakes up every tick to send them. With rate limiting
+    configured (rate_limit.py), throttled datagrams are dropped unanswered
+    before anything else looks at them.
+
+    Hot path: datagrams land in one preallocated buffer (`recvfrom_into`),
+    commands are compared as bytes and the reply is sent from the
+    formatter's reusable buffer. `limit` stops after that many packets
+    (used by the benchmarks).
+
+    With KERNEL_TIMESTAMPS the loop uses `recvmsg_into` instead, and reads
+    the kernel receive time from the ancillary data. Binary replies carry it
+    as the receive time (t2); t3 is still taken when the reply is built. The
+    gap between the kernel stamp and the loop picking the datagram up is
+    recorded as queueing delay. Text replies keep their single timestamp,
+    taken at transmit time.
+    """
+    buffer = bytearray(bufferSize)
+    receive_into = UDPServerSocket.recvfrom_into
+    receive_message = getattr(UDPServerSocket, "recvmsg_into", None)
+    kernel_timestamps = (KERNEL_TIMESTAMPS and ANCILLARY_SIZE and receive_message is not None
+                         and enable_kernel_timestamps(UDPServerSocket))
+    buffers = [buffer]
+    unpack_timespec = TIMESPEC.unpack
+    time_ns = time.time_ns
+    observe_queueing = QUEUEING.observe
+    to_ntp = udp_protocol.to_ntp
+    received_ns = None
+    sendto = UDPServerSocket.sendto
+    stamp = TimestampFormatter().stamp
+    binary_reply = udp_protocol.reply_buffers()
+    make_reply = udp_protocol.make_reply
+    ntp_now = udp_protocol.ntp_now
+    record = get_request_log().record
+    log = LOG_REQUESTS
+    count_text, count_binary = REQUESTS["text"].inc, REQUESTS["binary"].inc
+    count_text_reply, count_binary_reply = REPLIES["text"].inc, REPLIES["binary"].inc
+    count_ignored = IGNORED.inc
+    injector = fault_injector(faults, sendto)
+    # The injector has read the settings already: a worker (re)started while faults are set applies them
+    send_time = injector.submit if injector is not None and injector.active else sendto
+    waiting = False
+    gate = get_gate()
+    admit = gate.admit if gate is not None else None
+
+    for _ in itertools.repeat(None) if limit is None else range(limit):
+        if injector is not None:
+            if injector.wheel.pending:
+                injector.flush()
+            if waiting != bool(injector.wheel.pending):
+                waiting = not waiting
+                UDPServerSocket.settimeout(injector.wheel.tick if waiting else None)
+        try:
+            if kernel_timestamps:
+                nbytes, ancillary, _, clientAddress = receive_message(buffers, ANCILLARY_SIZE)
+                received_ns = None
+                for level, kind, data in ancillary:
+                    if level == socket.SOL_SOCKET and kind == SCM_TIMESTAMPNS:
+                        seconds, nanoseconds = unpack_timespec(data)
+                        received_ns = seconds * 1_000_000_000 + nanoseconds
+                        observe_queueing((time_ns() - received_ns) / 1e9)
+            else:
+                nbytes, clientAddress = receive_into(buffer)
+        except socket.timeout:
+            continue
+        # Checked after the receive: settings may have changed while it blocked
+        if injector is not None and faults[0] != injector.generation and injector.refresh():
+            send_time = injector.submit if injector.active else sendto
+        if admit is not None and not admit(buffer, nbytes, clientAddress[0]):
+            continue
+
+        # --- STANDARD CLIENT REQUESTS ---
+        if nbytes == 12 and buffer.startswith(CMD_REQUEST_TIME):
+            count_text()
+            if is_server_healthy.value:
+                # Normal behavior: Send time
+                reply = stamp()
+                if send_time(reply, clientAddress):
+                    count_text_reply()
+                    if log:
+                        record("responded", clientAddress, reply)
+                elif log:
+                    record("dropped", clientAddress)
+            else:
+                # Crashed behavior: DO NOTHING (Simulates a dropped packet or dead server)
+                count_ignored()
+                if log:
+                    record("ignored", clientAddress)
+
+        # --- BINARY PROTOCOL (udp_protocol.py) ---
+        elif nbytes >= 4 and buffer.startswith(BINARY_MAGIC):
+            count_binary()
+            if is_server_healthy.value:
+                t2 = to_ntp(received_ns) if received_ns is not None else ntp_now()
+                reply = make_reply(buffer, nbytes, t2, binary_reply)
+                if reply is None:
+                    INVALID.inc()
+                    sendto(REPLY_INVALID, clientAddress)
+                    if log:
+                        record("responded", clientAddress, binary_detail(buffer, nbytes))
+                elif send_time(reply, clientAddress):
+                    count_binary_reply()
+                    if log:
+                        record("responded", clientAddress, binary_detail(buffer, nbytes))
+                elif log:
+                    record("dropped", clientAddress, binary_detail(buffer, nbytes))
+            else:
+                count_ignored()
+                if log:
+                    record("ignored", clientAddress)
+
+        elif nbytes > len(CMD_HELLO) and buffer.startswith(CMD_HELLO):
+            reply = udp_protocol.answer_hello(buffer[:nbytes])
+            sendto(REPLY_INVALID if reply is None else reply, clientAddress)
+
+        # --- ADMIN COMMANDS (To simulate failures) ---
+        elif nbytes == 11 and buffer.startswith(CMD_ADMIN_CRASH):
+            ADMIN["crash"].inc()
+            is_server_healthy.value = False
+            record("admin", clientAddress, f"[ADMIN] Simulation Mode: CRASHED (Ignoring requests from {clientAddress})")
+            # We don't reply, just acknowledge in logs
+
+        elif nbytes == 12 and buffer.startswith(CMD_ADMIN_REPAIR):
+            ADMIN["repair"].inc()
+            is_server_healthy.value = True
+            record("admin", clientAddress, "[ADMIN] Simulation Mode: REPAIRED (Resuming normal service)")
+
+        elif nbytes == 5 and buffer.startswith(CMD_STATS):
+            if rate_limit.is_stats_allowed(gate, clientAddress[0]):
+                ADMIN["stats"].inc()
+                sendto(stats_reply(is_server_healthy), clientAddress)
+
+        elif faults is not None and nbytes >= len(CMD_ADMIN_FAULT) and buffer.startswith(CMD_ADMIN_FAULT) and \
+                admin_fault(faults, buffer[len(CMD_ADMIN_FAULT):nbytes], clientAddress, record):
+            ADMIN["fault"].inc()
+
         else:
-            # Crashed behavior: DO NOTHING (Simulates a dropped packet or dead server)
-            print(f"Request from {clientAddress} -> IGNORED (Simulated Crash)")
-    
+            INVALID.inc()
+            sendto(REPLY_INVALID, clientAddress)
+            if log:
+                record("invalid", clientAddress)
+
+
+class TimeServerProtocol(asyncio.DatagramProtocol):
+    """Same wire behaviour as `serve`, driven by the asyncio event loop.
+
+    Because the loop owns the socket, timers and other coroutines (see
+    `report_stats`) run alongside request handling.
+
+    The stock transport delivers one datagram per selector wakeup. To keep
+    up with the blocking loop, each wakeup also drains up to `batch` more
+    datagrams straight from the (non-blocking) socket before yielding back
+    to the loop.
+
+    Delayed fault-injection replies are sent from a timer that ticks only
+    while some are pending.
+    """
+
+    def __init__(self, UDPServerSocket, is_server_healthy, batch=64, faults=None):
+        self.socket = UDPServerSocket
+        self.is_server_healthy = is_server_healthy
+        self.faults = faults
+        self.injector = fault_injector(faults, self.reply)
+        # injector.submit while faults are set (the injector has read them already)
+        self.send_time = self.injector.submit if self.injector is not None and self.injector.active else None
+        self.timer = None
+        gate = self.gate = get_gate()
+        self.admit = gate.admit if gate is not None else None
+        self.batch = batch
+        self.buffer = bytearray(bufferSize)
+        self.binary_reply = udp_protocol.reply_buffers()
+        self.stamp = TimestampFormatter().stamp
+        self.record = get_request_log().record
+        self.log = LOG_REQUESTS
+        self.transport = None
+        self.requests = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, clientAddress):
+        injector = self.injector
+        if injector is not None and self.faults[0] != injector.generation and injector.refresh():
+            self.send_time = injector.submit if injector.active else None
+        admit = self.admit
+        if admit is None or admit(data, len(data), clientAddress[0]):
+            self.handle(data, clientAddress)
+        buffer = self.buffer
+        receive_into = self.socket.recvfrom_into
+        sendto = self.socket.sendto
+        stamp = self.stamp
+        for _ in range(self.batch):
+            try:
+                nbytes, clientAddress = receive_into(buffer)
+            except (BlockingIOError, InterruptedError):
+                break
+            if injector is not None and self.faults[0] != injector.generation and injector.refresh():
+                self.send_time = injector.submit if injector.active else None
+            if admit is not None and not admit(buffer, nbytes, clientAddress[0]):
+                continue
+            # Inline fast path for healthy time requests, everything else goes through handle()
+            if nbytes == 12 and buffer.startswith(CMD_REQUEST_TIME) and self.is_server_healthy.value:
+                self.requests += 1
+                REQUESTS["text"].inc()
+                reply = stamp()
+                if self.send_time is not None:
+                    if not self.send_time(reply, clientAddress):
+                        if self.log:
+                            self.record("dropped", clientAddress)
+                        continue
+                else:
+                    try:
+                        sendto(reply, clientAddress)
+                    except (BlockingIOError, InterruptedError):
+                        self.transport.sendto(bytes(reply), clientAddress)
+                REPLIES["text"].inc()
+                if self.log:
+                    self.record("responded", clientAddress, reply)
+            else:
+                self.handle(bytes(buffer[:nbytes]), clientAddress)
+        if injector is not None and injector.wheel.pending and self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(injector.wheel.tick, self.flush_delayed)
+
+    def reply(self, data, clientAddress):
+        try:
+            self.socket.sendto(data, clientAddress)
+        except (BlockingIOError, InterruptedError):
+            # Kernel send buffer full: let the transport queue a copy
+            self.transport.sendto(bytes(data), clientAddress)
+        return True
+
+    def flush_delayed(self):
+        self.injector.flush()
+        self.timer = None
+        if self.injector.wheel.pending:
+            self.timer = asyncio.get_running_loop().call_later(self.injector.wheel.tick, self.flush_delayed)
+
+    def handle(self, data, clientAddress):
+        # --- STANDARD CLIENT REQUESTS ---
+        if data == CMD_REQUEST_TIME:
+            self.requests += 1
+            REQUESTS["text"].inc()
+            if self.is_server_healthy.value:
+                reply = self.stamp()
+                if (self.send_time or self.reply)(reply, clientAddress):
+                    REPLIES["text"].inc()
+                    if self.log:
+                        self.record("responded", clientAddress, reply)
+                elif self.log:
+                    self.record("dropped", clientAddress)
+            else:
+                IGNORED.inc()
+                if self.log:
+                    self.record("ignored", clientAddress)
+
+        # --- BINARY PROTOCOL (udp_protocol.py) ---
+        elif data[:2] == BINARY_MAGIC:
+            REQUESTS["binary"].inc()
+            if self.is_server_healthy.value:
+                reply = udp_protocol.make_reply(data, len(data), udp_protocol.ntp_now(), self.binary_reply)
+                if reply is None:
+                    INVALID.inc()
+                    self.reply(REPLY_INVALID, clientAddress)
+                    if self.log:
+                        self.record("responded", clientAddress, binary_detail(data, len(data)))
+                elif (self.send_time or self.reply)(reply, clientAddress):
+                    REPLIES["binary"].inc()
+                    if self.log:
+                        self.record("responded", clientAddress, binary_detail(data, len(data)))
+                elif self.log:
+                    self.record("dropped", clientAddress, binary_detail(data, len(data)))
+            else:
+                IGNORED.inc()
+                if self.log:
+                    self.record("ignored", clientAddress)
+
+        elif data.startswith(CMD_HELLO):
+            reply = udp_protocol.answer_hello(data)
+            self.reply(REPLY_INVALID if reply is None else reply, clientAddress)
+
+        # --- ADMIN COMMANDS (To simulate failures) ---
+        elif data == CMD_ADMIN_CRASH:
+            ADMIN["crash"].inc()
+            self.is_server_healthy.value = False
+            self.record("admin", clientAddress, f"[ADMIN] Simulation Mode: CRASHED (Ignoring requests from {clientAddress})")
+
+        elif data == CMD_ADMIN_REPAIR:
+            ADMIN["repair"].inc()
+            self.is_server_healthy.value = True
+            self.record("admin", clientAddress, "[ADMIN] Simulation Mode: REPAIRED (Resuming normal service)")
+
+        elif data == CMD_STATS:
+            if rate_limit.is_stats_allowed(self.gate, clientAddress[0]):
+                ADMIN["stats"].inc()
+                self.reply(stats_reply(self.is_server_healthy), clientAddress)
+
+        elif self.faults is not None and data.startswith(CMD_ADMIN_FAULT) and \
+                admin_fault(self.faults, data[len(CMD_ADMIN_FAULT):], clientAddress, self.record):
+            ADMIN["fault"].inc()
+
+        else:
+            INVALID.inc()
+            self.reply(REPLY_INVALID, clientAddress)
+            if self.log:
+                self.record("invalid", clientAddress)
+
+
+async def report_stats(protocol, interval):
+    """Periodic task running next to the request handler."""
+    while True:
+        await asyncio.sleep(interval)
+        count, protocol.requests = protocol.requests, 0
+        if count:
+            print(f"[stats] {count} time requests in the last {interval:g}s "
+                  f"({count / interval:.1f}/s)", flush=True)
+
+
+async def serve_async(UDPServerSocket, is_server_healthy, faults=None):
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: TimeServerProtocol(UDPServerSocket, is_server_healthy, faults=faults), sock=UDPServerSocket)
+    try:
+        await report_stats(protocol, STATS_INTERVAL)
+    finally:
+        transport.close()
+
+
+def serve_asyncio(UDPServerSocket, is_server_healthy, faults=None):
+    """Run the asyncio engine, on uvloop when it is installed."""
+    loop = uvloop.new_event_loop() if uvloop else asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(serve_async(UDPServerSocket, is_server_healthy, faults))
+    finally:
+        loop.close()
+
+
+ENGINES = {"blocking": serve, "asyncio": serve_asyncio}
+
+
+def run_worker(worker_id, is_server_healthy, faults, reuse_port, port, engine):
+    UDPServerSocket = create_socket(reuse_port, port)
+    print(f"[worker {worker_id}] pid {os.getpid()} listening on {IPaddress}:{port} ({engine})", flush=True)
+    try:
+        ENGINES[engine](UDPServerSocket, is_server_healthy, faults=faults)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close_request_log()
+
+
+def start_worker(worker_id, is_server_healthy, faults, port, engine):
+    process = multiprocessing.Process(
+        target=run_worker, args=(worker_id, is_server_healthy, faults, True, port, engine),
+        name=f"udp-worker-{worker_id}", daemon=True)
+    process.start()
+    return process
+
+
+def supervise(num_workers, is_server_healthy, faults, port, engine):
+    """Start `num_workers` processes on the same port and restart any that die.
+
+    The surviving workers keep the port answering while a replacement starts,
+    so a single crash never makes the service go silent (with 2+ workers).
+    A worker that dies within RESTART_BACKOFF_RESET seconds of starting (bad
+    environment, bind error) is restarted after a growing delay instead of
+    in a tight loop.
+    """
+    workers = {i: start_worker(i, is_server_healthy, faults, port, engine) for i in range(num_workers)}
+    started = {i: time.monotonic() for i in workers}
+    backoff = dict.fromkeys(workers, 0.0)
+    restart_at = {}  # worker id -> monotonic time its replacement is due
+    try:
+        while True:
+            time.sleep(SUPERVISOR_INTERVAL)
+            now = time.monotonic()
+            for worker_id, process in list(workers.items()):
+                if process.is_alive():
+                    continue
+                if worker_id not in restart_at:
+                    process.join()
+                    if now - started[worker_id] >= RESTART_BACKOFF_RESET:
+                        backoff[worker_id] = 0.0
+                    else:
+                        backoff[worker_id] = min(max(2 * backoff[worker_id], SUPERVISOR_INTERVAL), RESTART_BACKOFF_MAX)
+                    restart_at[worker_id] = now + backoff[worker_id]
+                    delay = f" in {backoff[worker_id]:g}s" if backoff[worker_id] else ""
+                    print(f"[supervisor] worker {worker_id} (pid {process.pid}) exited "
+                          f"with code {process.exitcode}, restarting{delay}", flush=True)
+                if now >= restart_at[worker_id]:
+                    del restart_at[worker_id]
+                    workers[worker_id] = start_worker(worker_id, is_server_healthy, faults, port, engine)
+                    started[worker_id] = now
+    except KeyboardInterrupt:
+        print("[supervisor] shutting down")
+    finally:
+        for process in workers.values():
+            process.terminate()
+        for process in workers.values():
+            process.join()
+
+
+def stop_on_sigterm():
+    """Treat SIGTERM (docker stop, kill, Popen.terminate) like Ctrl+C, so the
+    supervisor still stops and joins its workers instead of orphaning them
+    on the port. Forked workers inherit it and exit through the same path."""
+    def interrupt(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, interrupt)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="UDP Time Server")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS,
+                        help="worker processes sharing the port via SO_REUSEPORT (env UDP_WORKERS)")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default=ENGINE,
+                        help="request engine (env UDP_ENGINE)")
+    parser.add_argument("--port", type=int, default=int(os.getenv("UDP_PORT", portNumber)),
+                        help="UDP port to listen on (env UDP_PORT)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    # Shared across processes: 'b' = signed char used as a boolean, no lock needed
+    is_server_healthy = multiprocessing.Value('b', True, lock=False)
+    # Fault injection settings (ADMIN_FAULT), shared the same way
+    faults = fault_injection.shared_config()
+
+    print(f"UDP Time Server running on {IPaddress}:{args.port} "
+          f"({args.workers} worker(s), {args.engine} engine{', uvloop' if uvloop and args.engine == 'asyncio' else ''})")
+    print("Waiting for requests...", flush=True)
+    stop_on_sigterm()
+
+    if args.workers <= 1:
+        try:
+            ENGINES[args.engine](create_socket(reuse_port=False, port=args.port), is_server_healthy, faults=faults)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            close_request_log()
     else:
-        UDPServerSocket.sendto("INVALID_REQUEST".encode(), clientAddress)
\ No newline at end of file
+        supervise(args.workers, is_server_healthy, faults, args.port, args.engine)
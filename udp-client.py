@@ -1,15 +1,66 @@
 import socket
-from flask import Flask, render_template_string, request
+from flask import Flask, jsonify, request
 from datetime import datetime
+import collections
 import os
+import threading
 import time
 
+import backend_pool
+import metrics
+import tracing
+import udp_protocol
+from clock_sync import ClockSynchronizer, filter_probes
+from single_flight import SingleFlight
+from udp_channel import UdpChannel
+
 app = Flask(__name__)
+# Keep /api/sync responses compact even with FLASK_DEBUG=1
+app.json.compact = True
+metrics.install(app)
 
 SERVER_IP = os.getenv("SERVER_IP", "127.0.0.1")
-UDP_SERVER_ADDRESS = (SERVER_IP, 5678)
+SERVER_PORT = 5678
+# SERVER_IP may list several backends ("a,b:5679"); a name with several
+# addresses (docker compose --scale) counts as one backend per address
+BACKENDS = backend_pool.parse_backends(SERVER_IP, SERVER_PORT)
 BUFFER_SIZE = 1024
+# Upper bound for one attempt; the actual timeout adapts to the measured RTT
 TIMEOUT_SECONDS = 2 
+# Retransmissions after the first attempt before we report a CRITICAL ERROR
+RETRIES = int(os.getenv("RETRIES", "2"))
+# Send a hedged duplicate once the first attempt is slower than this RTT percentile (0 = off)
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+# Wire protocol: "binary" (negotiated, falls back to text for legacy backends) or "text"
+UDP_PROTOCOL = os.getenv("UDP_PROTOCOL", "binary")
+
+# Health probes: interval, and consecutive failures before a backend is ejected
+PROBE_INTERVAL = float(os.getenv("PROBE_INTERVAL", "2"))
+EJECT_AFTER = int(os.getenv("EJECT_AFTER", "3"))
+# Seconds over which a re-admitted backend ramps up to its full share of traffic
+SLOW_START = float(os.getenv("SLOW_START", "10"))
+
+# Clock cache: answer syncs from a periodically refreshed offset estimate
+CLOCK_CACHE = os.getenv("CLOCK_CACHE", "1") == "1"
+CLOCK_SYNC_INTERVAL = float(os.getenv("CLOCK_SYNC_INTERVAL", "2"))
+# Seconds without a successful sample before the cached offset is stale
+CLOCK_STALE_AFTER = float(os.getenv("CLOCK_STALE_AFTER", "10"))
+# Most live samples one /api/sync?batch=N call may ask for
+MAX_BATCH = int(os.getenv("MAX_BATCH", "32"))
+# Probes per live sync: sent at once, the lowest-delay answer wins (1 = single request)
+SYNC_PROBES = int(os.getenv("SYNC_PROBES", "4"))
+MAX_PROBES = 16
+# Live syncs starting within this many ms of an in-flight one share its result (0 = off)
+COALESCE_WINDOW_MS = float(os.getenv("COALESCE_WINDOW_MS", "10"))
+# Trace syncs (tracing.py): Server-Timing header, trace ID on the wire, /debug/traces
+TRACING = os.getenv("TRACING", "1") == "1"
+
+# Shared socket + receiver thread, backend pool and clock synchronizer,
+# started on first use (one per process)
+channel = None
+pool = None
+clock = None
+startup_lock = threading.Lock()
 
 HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -34,8 +85,17 @@ HTML_TEMPLATE = """
         .btn-main { background: #e67e22; color: white; border: none; padding: 15px 30px; font-size: 1.1em; border-radius: 50px; cursor: pointer; display: block; margin: 0 auto; width: 100%; }
         .btn-main:hover { background: #d35400; }
 
+        .transport-stats { margin: 15px auto 0; font-size: 0.85em; color: #666; border-collapse: collapse; }
+        .transport-stats th { text-align: left; color: #2c3e50; padding: 4px 12px; }
+        .transport-stats td { padding: 2px 12px; }
+
+        .live-option { display: block; text-align: center; margin-top: 8px; color: #666; font-size: 0.9em; }
+        .clock-cache { text-align: center; color: #666; font-size: 0.85em; }
+        .clock-stale { color: #c0392b; }
+
         .admin-panel { margin-top: 40px; padding-top: 20px; border-top: 2px dashed #ccc; text-align: center; }
         .admin-controls { display: flex; justify-content: center; gap: 20px; margin-top: 10px; }
+        .target-select { padding: 10px; border-radius: 5px; border: 1px solid #ccc; }
         .btn-crash { background: #c0392b; color: white; padding: 10px 20px; border: none; border-radius: 5px; cursor: pointer; }
         .btn-repair { background: #27ae60; color: white; padding: 10px 20px; border: none; border-radius: 5px; cursor: pointer; }
     </style>
@@ -52,93 +112,501 @@ HTML_TEMPLATE = """
             <div class="mermaid">
                 graph LR
                 Client(Client App<br>Flask)
-                Backend(Backend Svr<br>UDP :5678)
-                
                 style Client fill:#3498db,stroke:#2980b9,color:white
                 
-                {% if status_class == 'status-error' %}
+                {% for b in backends %}
+                B{{ loop.index }}("Backend {{ loop.index }}<br>{{ b.label }}<br>{{ b.state }}{% if b.latency_ms is not none %} · {{ b.latency_ms }} ms{% endif %}")
+                {% if status_class == 'status-error' and b.label == used_backend %}
                     %% CRASH STATE
-                    Client -.-x|TIMEOUT| Backend
-                    style Backend fill:#e74c3c,stroke:#c0392b,color:white,stroke-dasharray: 5 5
+                    Client -.-x|TIMEOUT| B{{ loop.index }}
+                    style B{{ loop.index }} fill:#e74c3c,stroke:#c0392b,color:white,stroke-dasharray: 5 5
+                {% elif b.state == 'ejected' %}
+                    %% EJECTED: no traffic, health probes only
+                    Client -.-x|EJECTED| B{{ loop.index }}
+                    style B{{ loop.index }} fill:#e74c3c,stroke:#c0392b,color:white,stroke-dasharray: 5 5
+                {% elif b.state == 'recovering' %}
+                    %% RE-ADMITTED: slow start
+                    Client -. slow start .-> B{{ loop.index }}
+                    style B{{ loop.index }} fill:#f39c12,stroke:#e67e22,color:white
                 {% else %}
                     %% NORMAL STATE
-                    Client -- UDP Request --> Backend
-                    style Backend fill:#27ae60,stroke:#2ecc71,color:white
+                    Client -- UDP Request --> B{{ loop.index }}
+                    style B{{ loop.index }} fill:#27ae60,stroke:#2ecc71,color:white
                 {% endif %}
+                {% endfor %}
             </div>
         </div>
 
         <form action="/" method="POST">
             <input type="hidden" name="action" value="sync">
             <button type="submit" class="btn-main">Sync Time</button>
+            <label class="live-option"><input type="checkbox" name="live" value="1"> Force live round trip (skip the clock cache)</label>
+            <label class="live-option">Probes per sync <input type="number" name="probes" min="1" max="{{ max_probes }}" value="{{ probes }}" style="width: 3em;"></label>
         </form>
 
+        {% if estimate %}
+        <p class="clock-cache {{ 'clock-stale' if estimate.stale else '' }}">
+            Clock cache: offset <strong>{{ "%.3f"|format(estimate.offset * 1000) }} ms</strong>
+            &middot; error bound <strong>± {{ "%.3f"|format(estimate.error * 1000) }} ms</strong>
+            &middot; drift {{ "%.1f"|format(estimate.drift * 1e6) }} ppm
+            &middot; last sample {{ "%.1f"|format(estimate.since_sample) }} s ago ({{ estimate.samples }} samples)
+            {% if estimate.stale %}&middot; <strong>STALE</strong> (backend not answering){% endif %}
+        </p>
+        {% endif %}
+
         {% if rtt %}
-        <p style="text-align: center; color: #666;">Latency: <strong>{{ rtt }} ms</strong></p>
+        <p style="text-align: center; color: #666;">Latency: <strong>{{ rtt }} ms</strong>{% if used_backend %} (via {{ used_backend }}){% endif %}</p>
+        {% endif %}
+        {% if sample %}
+        <p style="text-align: center; color: #666; font-size: 0.9em;">
+            Protocol: <strong>{{ sample.protocol }}</strong>
+            {% if sample.offset is not none %}
+            &middot; Clock offset: <strong>{{ "%.3f"|format(sample.offset * 1000) }} ms</strong>
+            &middot; Network delay: <strong>{{ "%.3f"|format(sample.delay * 1000) }} ms</strong>
+            {% endif %}
+            {% if sample.probes %}
+            <br>Best of {{ sample.probes.answered }}/{{ sample.probes.sent }} probes
+            &middot; error bound ± {{ "%.3f"|format(sample.delay * 500) }} ms
+            &middot; spread {{ "%.3f"|format(sample.probes.spread * 1000) }} ms
+            {% if sample.probes.rejected %}&middot; {{ sample.probes.rejected }} outlier(s) rejected{% endif %}
+            {% endif %}
+        </p>
+        {% endif %}
+
+        {% if transport %}
+        <table class="transport-stats">
+            <tr><th colspan="2">RTT estimator</th><th colspan="2">Requests</th></tr>
+            <tr><td>SRTT</td><td>{{ "%.2f ms"|format(transport.srtt * 1000) if transport.srtt is not none else "n/a" }}</td>
+                <td>Sent</td><td>{{ transport.requests }}</td></tr>
+            <tr><td>RTTVAR</td><td>{{ "%.2f ms"|format(transport.rttvar * 1000) if transport.rttvar is not none else "n/a" }}</td>
+                <td>Retries</td><td>{{ transport.retries }}</td></tr>
+            <tr><td>Timeout (RTO)</td><td>{{ "%.2f ms"|format(transport.rto * 1000) }}</td>
+                <td>Hedges (won)</td><td>{{ transport.hedges }} ({{ transport.hedge_wins }})</td></tr>
+            <tr><td>Hedge after</td><td>{{ "%.2f ms"|format(transport.hedge_delay * 1000) if transport.hedge_delay is not none else "n/a" }}</td>
+                <td>Timeouts</td><td>{{ transport.timeouts }}</td></tr>
+        </table>
         {% endif %}
 
         <div class="admin-panel">
             <h3>⚠️ Instructor Controls (Chaos Engineering)</h3>
-            <div class="admin-controls">
-                <form action="/" method="POST">
-                    <input type="hidden" name="action" value="crash">
-                    <button type="submit" class="btn-crash">💥 Simulate Crash</button>
-                </form>
-                <form action="/" method="POST">
-                    <input type="hidden" name="action" value="repair">
-                    <button type="submit" class="btn-repair">🔧 Repair Server</button>
-                </form>
-            </div>
+            <form action="/" method="POST" class="admin-controls">
+                <select name="target" class="target-select">
+                    <option value="all">All backends</option>
+                    {% for b in backends %}
+                    <option value="{{ b.label }}">{{ b.label }}</option>
+                    {% endfor %}
+                </select>
+                <button type="submit" name="action" value="crash" class="btn-crash">💥 Simulate Crash</button>
+                <button type="submit" name="action" value="repair" class="btn-repair">🔧 Repair Server</button>
+            </form>
         </div>
     </div>
 </body>
 </html>
 """
 
-def send_udp_command(command):
+TRACES_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Sync traces</title>
+    <style>
+        body { font-family: 'Segoe UI', sans-serif; background: #f4f7f6; padding: 20px; }
+        .container { max-width: 1000px; margin: 0 auto; background: white; padding: 30px; border-radius: 12px; box-shadow: 0 4px 15px rgba(0,0,0,0.1); }
+        h1, h2 { color: #2c3e50; }
+        table { width: 100%; border-collapse: collapse; font-size: 0.85em; margin-bottom: 30px; }
+        th, td { padding: 4px 8px; border-bottom: 1px solid #eee; text-align: left; vertical-align: top; }
+        td.num { text-align: right; font-family: monospace; }
+        code { font-size: 0.95em; }
+        .bar { background: #3498db; height: 10px; display: inline-block; min-width: 1px; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>🔍 Sync traces</h1>
+        <p>{{ recorded }} traces recorded. Span durations in ms; <em>backend</em> is the backend's t3 &minus; t2 and lies inside <em>receive</em>.
+           <a href="/debug/traces?format=json">JSON</a></p>
+        {% if trace %}
+        <h2>Trace <code>{{ trace.trace_id }}</code> ({{ trace.name }}, {{ "%.3f"|format(trace.duration_ms) }} ms)</h2>
+        <table>
+            <tr><th>Span</th><th>Start</th><th>Duration</th><th></th></tr>
+            {% for s in trace.spans %}
+            <tr><td>{{ s.name }}</td>
+                <td class="num">{{ "%.3f"|format(s.start_ms) if s.start_ms is not none else "" }}</td>
+                <td class="num">{{ "%.3f"|format(s.duration_ms) }}</td>
+                <td><span class="bar" style="margin-left: {{ (s.start_ms or 0) / trace.duration_ms * 400 }}px; width: {{ s.duration_ms / trace.duration_ms * 400 }}px"></span></td></tr>
+            {% endfor %}
+        </table>
+        <p>{% for key, value in trace.notes.items() %}{{ key }}: <strong>{{ value }}</strong> {% endfor %}</p>
+        {% endif %}
+        {% for title, traces in sections %}
+        <h2>{{ title }}</h2>
+        <table>
+            <tr><th>Trace</th><th>View</th><th>Total</th><th>Spans</th><th>Notes</th></tr>
+            {% for t in traces %}
+            <tr><td><a href="/debug/traces?id={{ t.trace_id }}"><code>{{ t.trace_id }}</code></a></td>
+                <td>{{ t.name }}</td>
+                <td class="num">{{ "%.3f"|format(t.duration_ms) }}</td>
+                <td>{% for s in t.spans %}{{ s.name }} {{ "%.3f"|format(s.duration_ms) }}{% if not loop.last %} &middot; {% endif %}{% endfor %}</td>
+                <td>{% for key, value in t.notes.items() %}{{ key }}={{ value }} {% endfor %}</td></tr>
+            {% endfor %}
+        </table>
+        {% endfor %}
+    </div>
+</body>
+</html>
+"""
+
+# Compiled once; render_template_string would re-parse the template on every request
+PAGE = app.jinja_env.from_string(HTML_TEMPLATE)
+TRACES_PAGE = app.jinja_env.from_string(TRACES_TEMPLATE)
+
+# Metrics (served on /metrics): syncs by outcome, live sync RTT, page render time
+SYNCS = {result: metrics.REGISTRY.counter("udp_client_syncs_total", "Syncs by outcome (cache = answered from the clock cache)",
+                                          {"result": result})
+         for result in ("ok", "timeout", "error", "cache")}
+SYNC_RTT = metrics.REGISTRY.histogram("udp_client_sync_rtt_seconds", "Round trip of live syncs, including failover")
+RENDER_TIME = metrics.REGISTRY.histogram("udp_client_render_seconds", "Time to render the HTML page")
+SYNC_FLIGHTS = SingleFlight(COALESCE_WINDOW_MS / 1000)
+TRACES = tracing.TraceStore.from_env()
+if TRACING:
+    tracing.install(app, TRACES, endpoints={"home", "api_sync"})
+metrics.REGISTRY.callback("udp_client_sync_flights_total", "Live syncs that led a backend request or joined one in flight",
+                          lambda: {"label": "role", "values": {"leader": SYNC_FLIGHTS.leaders,
+                                                               "follower": SYNC_FLIGHTS.followers}},
+                          kind="counter")
+metrics.REGISTRY.callback("udp_client_sync_coalescing_ratio", "Fraction of live syncs answered by another sync's request",
+                          SYNC_FLIGHTS.ratio)
+metrics.REGISTRY.callback("udp_client_traces_total", "Sync traces recorded (tracing.py)",
+                          lambda: TRACES.recorded, kind="counter")
+metrics.REGISTRY.callback("udp_client_channel_events_total", "UDP channel events (requests, retries, hedges, timeouts, ...)",
+                          lambda: channel and {"label": "event", "values": dict(
+                              channel.counters, stale=channel.stale, unexpected=channel.unexpected)},
+                          kind="counter")
+metrics.REGISTRY.callback("udp_client_backends", "Backends by health state",
+                          lambda: pool and {"label": "state", "values": collections.Counter(
+                              b.state for b in pool.snapshot())})
+
+def get_channel():
+    global channel
+    with startup_lock:
+        if channel is None:
+            channel = UdpChannel(BUFFER_SIZE, retries=RETRIES, max_timeout=TIMEOUT_SECONDS,
+                                 hedge_percentile=HEDGE_PERCENTILE).start()
+    return channel
+
+def get_pool():
+    global pool
+    get_channel()
+    with startup_lock:
+        if pool is None:
+            pool = backend_pool.BackendPool(BACKENDS, probe_backend, probe_interval=PROBE_INTERVAL,
+                                            eject_after=EJECT_AFTER, slow_start=SLOW_START).start()
+    return pool
+
+def get_clock():
+    global clock
+    get_pool()
+    with startup_lock:
+        if clock is None:
+            clock = ClockSynchronizer(sample_clock, interval=CLOCK_SYNC_INTERVAL,
+                                      stale_after=CLOCK_STALE_AFTER).start()
+    return clock
+
+def negotiate(backend):
+    """Handshake in ASCII so a legacy backend just answers INVALID_REQUEST.
+
+    The reply has no request ID, so it uses its own short-lived socket."""
+    if UDP_PROTOCOL != "binary":
+        backend.version = 0
+        return
     with socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM) as s:
-        s.sendto(command.encode(), UDP_SERVER_ADDRESS)
+        s.settimeout(TIMEOUT_SECONDS)
+        s.sendto(udp_protocol.encode_hello(), backend.address)
+        msg, _ = s.recvfrom(BUFFER_SIZE)
+    backend.version = udp_protocol.parse_hello_reply(msg) or 0
+
+def request_time(backend, retries=None, hedge=True, counted=True, probes=1):
+    """Ask one backend for the time.
+
+    Uses the binary protocol (udp_protocol.py) over the shared channel when
+    the backend speaks it, which gives us the NTP clock offset and network
+    delay without any string parsing; otherwise the legacy text protocol.
+    With probes > 1 (binary only) that many requests go out at once and the
+    one with the lowest delay is used (clock_sync.filter_probes).
+    """
+    if backend.version is None:
+        with tracing.span("negotiate"):
+            negotiate(backend)
+
+    while backend.version:
+        if probes > 1:
+            replies = get_channel().request_burst(backend.address, backend.version, probes,
+                                                  retries=retries, hedge=hedge)
+        else:
+            replies = [get_channel().request_time(backend.address, backend.version, retries=retries,
+                                                  hedge=hedge, counted=counted)]
+        if any(reply.type == udp_protocol.TYPE_VERSION_NOT_SUPPORTED for reply, _ in replies):
+            # The backend changed under us: negotiate again
+            with tracing.span("negotiate"):
+                negotiate(backend)
+            continue
+        with tracing.span("parse"):
+            measured = [udp_protocol.offset_and_delay(reply.t1, reply.t2, reply.t3, t4) for reply, t4 in replies]
+            result = filter_probes(measured)
+            reply = replies[result.best][0]
+            sample = {
+                "server_time": datetime.fromtimestamp(udp_protocol.from_ntp(reply.t3)),
+                "offset": result.offset,
+                "delay": result.delay,
+                "protocol": f"binary v{reply.version}",
+                "probes": {"sent": probes, "answered": len(replies), "rejected": result.rejected,
+                           "spread": result.spread} if probes > 1 else None,
+            }
+        trace = tracing.current()
+        if trace is not None:
+            # Backend handling time: t3 - t2 on the backend's clock, inside "receive"
+            trace.add("backend", (reply.t3 - reply.t2) * 1_000_000_000 >> 32)
+            trace.note(backend=backend.label(), echoed=reply.trace_id == trace.trace_id)
+        return sample
+
+    # Legacy text replies carry no request ID, so they get a private socket
+    with tracing.span("acquire"):
+        s = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+    with s:
+        s.settimeout(TIMEOUT_SECONDS)
+        t1 = time.time()
+        with tracing.span("send"):
+            s.sendto("REQUEST_TIME".encode(), backend.address)
+        with tracing.span("receive"):
+            msg, _ = s.recvfrom(BUFFER_SIZE)
+        t4 = time.time()
+    with tracing.span("parse"):
+        server_time = datetime.strptime(msg.decode(), '%Y-%m-%d %H:%M:%S.%f')
+    # No server receive/transmit stamps: assume the reply was stamped halfway
+    return {
+        "server_time": server_time,
+        "offset": server_time.timestamp() - (t1 + t4) / 2,
+        "delay": t4 - t1,
+        "protocol": "text",
+        "probes": None,
+    }
+
+def probe_backend(backend):
+    """Health probe: one attempt, no hedging. Returns the RTT in seconds."""
+    start = time.perf_counter()
+    request_time(backend, retries=0, hedge=False, counted=False)
+    return time.perf_counter() - start
+
+def sync_time(tried, probes=SYNC_PROBES):
+    """Pick a backend (power of two choices) and sync with it. If it does not
+    answer, fail over to one other backend before giving up. Backends used
+    are appended to `tried`."""
+    began = time.perf_counter()
+    while True:
+        with tracing.span("acquire"):
+            backend = get_pool().choose(exclude=[b.address for b in tried])
+        tried.append(backend)
+        start = time.perf_counter()
+        try:
+            sample = request_time(backend, probes=probes)
+        except OSError as e:
+            pool.release(backend, None)
+            if len(tried) >= 2 or len(tried) >= len(pool.snapshot()):
+                SYNCS["timeout" if isinstance(e, socket.timeout) else "error"].inc()
+                raise
+            continue
+        except Exception:
+            pool.release(backend, None)  # in_flight feeds the pool's choice: never leak it
+            SYNCS["error"].inc()
+            raise
+        now = time.perf_counter()
+        pool.release(backend, now - start)
+        SYNCS["ok"].inc()
+        SYNC_RTT.observe(now - began)
+        return sample
+
+def live_sync(tried, probes):
+    """A live sync for an HTTP request, coalesced with concurrent ones
+    (single_flight.py, COALESCE_WINDOW_MS). Only the leader talks to the
+    backend and feeds the clock cache. Followers get its result or error,
+    and its backends are added to their `tried`, so a failure marks the
+    same backend. Returns (sample, backend label, coalesced). A coalesced
+    caller's trace gets a "coalesced" span for the wait and the leader's
+    trace ID."""
+    def lead():
+        try:
+            sample = sync_time(tried, probes)
+        except Exception as e:
+            e.tried = list(tried)  # shared with the followers, who re-raise the same exception
+            raise
+        if CLOCK_CACHE:
+            get_clock().add_sample(sample["offset"], sample["delay"])
+        trace = tracing.current()
+        return sample, list(tried), trace and trace.trace_id
+    start = time.perf_counter_ns()
+    try:
+        (sample, used, leader), coalesced = SYNC_FLIGHTS.do(probes, lead)
+    except Exception as e:
+        if not tried:
+            tried.extend(getattr(e, "tried", ()))
+        raise
+    if coalesced:
+        tried.extend(used)
+    backend = tried[-1].label()
+    trace = tracing.current()
+    if coalesced and trace is not None:
+        trace.add("coalesced", time.perf_counter_ns() - start, start)
+        trace.note(backend=backend, shared_trace=f"{leader:016x}" if leader else None)
+    return sample, backend, coalesced
+
+def sample_clock():
+    """One sample for the clock synchronizer: (offset, delay) in seconds."""
+    sample = sync_time([])
+    return sample["offset"], sample["delay"]
+
+def send_udp_command(command, target="all"):
+    backends = get_pool().snapshot() if target == "all" else [pool.get(target)]
+    for backend in filter(None, backends):
+        get_channel().send(command.encode(), backend.address)
+
+def backend_view():
+    return [{
+        "label": b.label(),
+        "state": b.state,
+        "latency_ms": round(b.latency * 1000, 2) if b.latency is not None else None,
+    } for b in get_pool().snapshot()]
 
 @app.route("/", methods=["GET", "POST"])
 def home():
     status_message = "System Ready."
     status_class = "status-idle"
     rtt = None
+    sample = None
+    used_backend = None
+    estimate = get_clock().estimate() if CLOCK_CACHE else None
+    probes = max(1, min(request.form.get("probes", SYNC_PROBES, type=int), MAX_PROBES))
+    trace = tracing.current()
+    if trace is not None:
+        trace.mark("http")
     
     if request.method == "POST":
         action = request.form.get("action")
+        target = request.form.get("target", "all")
+        target_name = "All servers" if target == "all" else f"Server {target}"
 
         if action == "crash":
-            send_udp_command("ADMIN_CRASH")
-            status_message = "💀 Server CRASHED. Try Syncing now."
+            send_udp_command("ADMIN_CRASH", target)
+            status_message = f"💀 {target_name} CRASHED. Try Syncing now."
             status_class = "status-idle" # Diagram stays green until they TRY to sync
 
         elif action == "repair":
-            send_udp_command("ADMIN_REPAIR")
-            status_message = "🟢 Server REPAIRED."
+            send_udp_command("ADMIN_REPAIR", target)
+            status_message = f"🟢 {target_name} REPAIRED."
             status_class = "status-idle"
 
+        elif action == "sync" and estimate and not estimate.stale and not request.form.get("live"):
+            # Answered from the clock cache: no UDP round trip
+            SYNCS["cache"].inc()
+            server_time = datetime.fromtimestamp(estimate.server_time)
+            status_message = (f"✅ Success! Server Time: {server_time.strftime('%H:%M:%S')} "
+                              f"(cached estimate ± {estimate.error * 1000:.2f} ms)")
+            status_class = "status-success"
+
         elif action == "sync":
-            start = time.time()
-            with socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM) as s:
-                s.settimeout(TIMEOUT_SECONDS)
-                try:
-                    s.sendto("REQUEST_TIME".encode(), UDP_SERVER_ADDRESS)
-                    msg, _ = s.recvfrom(BUFFER_SIZE)
-                    
-                    rtt = round((time.time() - start) * 1000, 2)
-                    server_time = datetime.strptime(msg.decode(), '%Y-%m-%d %H:%M:%S.%f')
-                    status_message = f"✅ Success! Server Time: {server_time.strftime('%H:%M:%S')}"
-                    status_class = "status-success"
-                    
-                except socket.timeout:
-                    status_message = f"⚠️ CRITICAL ERROR: Connection Timed Out ({TIMEOUT_SECONDS}s)"
-                    status_class = "status-error"
-                except Exception as e:
-                    status_message = f"Error: {e}"
-                    status_class = "status-error"
-
-    return render_template_string(HTML_TEMPLATE, status_message=status_message, status_class=status_class, target_server=SERVER_IP, rtt=rtt)
+            start = time.perf_counter()
+            tried = []
+            try:
+                sample, used_backend, coalesced = live_sync(tried, probes)
+                
+                rtt = round((time.perf_counter() - start) * 1000, 2)
+                server_time = sample["server_time"]
+                status_message = f"✅ Success! Server Time: {server_time.strftime('%H:%M:%S')}"
+                if coalesced:
+                    status_message += " (shared with a concurrent sync)"
+                status_class = "status-success"
+                
+            except socket.timeout as e:
+                status_message = f"⚠️ CRITICAL ERROR: Connection Timed Out ({e or f'{TIMEOUT_SECONDS}s'})"
+                status_class = "status-error"
+            except Exception as e:
+                status_message = f"Error: {e}"
+                status_class = "status-error"
+            if tried:
+                used_backend = tried[-1].label()
+
+    backends = backend_view()
+    stats_backend = get_pool().get(used_backend) if used_backend else (pool.snapshot() or [None])[0]
+    transport = get_channel().stats(stats_backend.address) if stats_backend else None
+    with RENDER_TIME.time(), tracing.span("render"):
+        return PAGE.render(status_message=status_message, status_class=status_class, target_server=SERVER_IP, rtt=rtt, sample=sample, transport=transport, backends=backends, used_backend=used_backend, estimate=estimate, probes=probes, max_probes=MAX_PROBES)
+
+def sync_record(live=False, probes=SYNC_PROBES):
+    """One sync for the JSON API, as a small dict. Never raises: failures
+    are reported in "status" ("ok", "timeout" or "error")."""
+    estimate = get_clock().estimate() if CLOCK_CACHE and not live else None
+    if estimate and not estimate.stale:
+        SYNCS["cache"].inc()
+        return {"status": "ok", "source": "cache", "server_time": round(estimate.server_time, 6),
+                "error_ms": round(estimate.error * 1000, 3), "rtt_ms": None, "backend": None}
+    tried = []
+    start = time.perf_counter()
+    try:
+        sample, backend, coalesced = live_sync(tried, probes)
+    except socket.timeout as e:
+        record = {"status": "timeout", "error": str(e) or f"{TIMEOUT_SECONDS}s"}
+    except Exception as e:
+        record = {"status": "error", "error": str(e)}
+    else:
+        record = {"status": "ok", "source": "live", "server_time": round(sample["server_time"].timestamp(), 6),
+                  "error_ms": round(sample["delay"] * 500, 3),
+                  "rtt_ms": round((time.perf_counter() - start) * 1000, 3), "backend": backend, "coalesced": coalesced}
+        probes = sample["probes"]
+        if probes:
+            record["probes"] = {"sent": probes["sent"], "answered": probes["answered"],
+                                "rejected": probes["rejected"], "spread_ms": round(probes["spread"] * 1000, 3)}
+    record.setdefault("backend", tried[-1].label() if tried else None)
+    return record
+
+@app.route("/api/sync")
+def api_sync():
+    """Machine-facing sync: compact JSON instead of the HTML page.
+
+    server_time is Unix seconds. Answered from the clock cache unless
+    ?live=1 or the cache is stale. ?batch=N takes N live samples (at most
+    MAX_BATCH) in one call and returns them under "samples". ?probes=N sets
+    how many probes a live sync sends at once (at most MAX_PROBES)."""
+    probes = max(1, min(request.args.get("probes", SYNC_PROBES, type=int), MAX_PROBES))
+    batch = request.args.get("batch", type=int)
+    trace = tracing.current()
+    if trace is not None:
+        trace.mark("http")
+    if batch is None:
+        record = sync_record(live=request.args.get("live") == "1", probes=probes)
+        codes = {"ok": 200, "timeout": 504}
+        with tracing.span("render"):
+            return jsonify(record), codes.get(record["status"], 502)
+    batch = max(1, min(batch, MAX_BATCH))
+    samples = [sync_record(live=True, probes=probes) for _ in range(batch)]
+    ok = sum(1 for s in samples if s["status"] == "ok")
+    with tracing.span("render"):
+        return jsonify({"status": "ok" if ok else "error", "ok": ok, "samples": samples}), 200 if ok else 502
+
+@app.route("/debug/traces")
+def debug_traces():
+    """Recent traces and the slowest ones kept (TRACE_RECENT, TRACE_SLOWEST).
+    ?id=<trace ID> shows one trace's spans; ?format=json returns them all."""
+    recent = [trace.to_dict() for trace in TRACES.recent()]
+    slowest = [trace.to_dict() for trace in TRACES.slowest()]
+    if request.args.get("format") == "json":
+        return jsonify({"recorded": TRACES.recorded, "recent": recent, "slowest": slowest})
+    try:
+        trace = TRACES.find(int(request.args.get("id", ""), 16))
+    except ValueError:
+        trace = None
+    return TRACES_PAGE.render(recorded=TRACES.recorded, trace=trace and trace.to_dict(),
+                              sections=[(f"Slowest {len(slowest)}", slowest), (f"Recent {len(recent)}", recent)])
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5001, debug=True)
\ No newline at end of file
+    # Development server; production runs through serve.py
+    app.run(host="0.0.0.0", port=5001, debug=os.getenv("FLASK_DEBUG") == "1")
\ No newline at end of file
@@ -0,0 +1,309 @@
+"""Load generator and latency benchmark for the UDP backend.
+
+Drives time requests from several client processes, either
+  * closed loop: every process keeps `--inflight` requests outstanding, or
+  * open loop:   all processes together send at a fixed `--rate` (req/s),
+                 whether or not replies come back,
+and records latency into a log-bucketed histogram (histogram.py), plus loss,
+reordering and duplicate replies. The binary protocol (udp_protocol.py) is
+used by default because its request IDs and echoed send times make those
+measurements exact; `--protocol text` sends REQUEST_TIME and pairs replies
+in FIFO order (latency is then approximate and reordering is not detected).
+
+By default it spawns `udp-backend.py` locally once per `--engines` entry,
+so it runs on one machine. `--target host:port` benchmarks a running
+backend instead. Results are printed as JSON (stdout, or `--json FILE`)
+so runs can be compared across changes; a short table goes to stderr.
+
+    python udp-loadtest.py --engines blocking asyncio --duration 5
+    python udp-loadtest.py --mode open --rate 20000 --processes 2 --json run.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import udp_protocol
+from histogram import LogHistogram
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REQUEST = b"REQUEST_TIME"
+# Seconds to keep collecting late replies after the sending phase
+DRAIN_SECONDS = 0.5
+# Closed loop: a window with no reply for this long is presumed lost and refilled
+WINDOW_TIMEOUT = 0.2
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_backend(engine, port, workers=1):
+    env = dict(os.environ, LOG_REQUESTS="0", STATS_INTERVAL="3600")
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "udp-backend.py"),
+         "--engine", engine, "--port", str(port), "--workers", str(workers)],
+        env=env, stdout=subprocess.DEVNULL)
+    wait_until_ready(("127.0.0.1", port))
+    return process
+
+
+def wait_until_ready(target, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.settimeout(0.1)
+        while time.monotonic() < deadline:
+            s.sendto(REQUEST, target)
+            try:
+                s.recv(64)
+                return
+            except socket.timeout:
+                pass
+    raise RuntimeError(f"backend at {target} did not answer within {timeout}s")
+
+
+class Tracker:
+    """Per-process bookkeeping: latency histogram (microseconds), loss,
+    reordering and duplicates."""
+
+    def __init__(self):
+        self.histogram = LogHistogram()
+        self.sent = 0
+        self.received = 0
+        self.reordered = 0
+        self.duplicates = 0
+        self.highest = -1
+        self.seen = bytearray()
+
+    def on_reply(self, data, now_ntp):
+        try:
+            packet = udp_protocol.decode(data)
+        except ValueError:
+            return
+        seq = packet.request_id
+        if seq >= len(self.seen):
+            self.seen.extend(bytes(max(seq + 1 - len(self.seen), 4096)))
+        if self.seen[seq]:
+            self.duplicates += 1
+            return
+        self.seen[seq] = 1
+        self.received += 1
+        if seq < self.highest:
+            self.reordered += 1
+        else:
+            self.highest = seq
+        self.histogram.record((now_ntp - packet.t1) * 1_000_000 >> 32)
+
+    def result(self):
+        return {"sent": self.sent, "received": self.received, "reordered": self.reordered,
+                "duplicates": self.duplicates, "histogram": self.histogram.state()}
+
+
+def binary_driver(target, mode, duration, inflight, rate, results):
+    tracker = Tracker()
+    encode, ntp_now = udp_protocol.encode_request, udp_protocol.ntp_now
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+        s.connect(target)
+
+        def send():
+            s.send(encode(tracker.sent, ntp_now()))
+            tracker.sent += 1
+
+        start = time.perf_counter()
+        deadline = start + duration
+        if mode == "closed":
+            s.settimeout(WINDOW_TIMEOUT)
+            for _ in range(inflight):
+                send()
+            while True:
+                try:
+                    data = s.recv(64)
+                except socket.timeout:
+                    if time.perf_counter() >= deadline:
+                        break
+                    for _ in range(inflight):  # window presumed lost: refill it
+                        send()
+                    continue
+                tracker.on_reply(data, ntp_now())
+                if time.perf_counter() >= deadline:
+                    break
+                send()
+        else:
+            interval = 1.0 / rate
+            next_send = start
+            while True:
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                while next_send <= now:
+                    send()
+                    next_send += interval
+                s.settimeout(max(0.0, next_send - time.perf_counter()))
+                try:
+                    while True:
+                        tracker.on_reply(s.recv(64), ntp_now())
+                        s.settimeout(0.0)
+                except (socket.timeout, BlockingIOError):
+                    pass
+        elapsed = time.perf_counter() - start
+
+        # Collect stragglers
+        s.settimeout(DRAIN_SECONDS)
+        try:
+            while True:
+                tracker.on_reply(s.recv(64), ntp_now())
+        except socket.timeout:
+            pass
+    results.put(dict(tracker.result(), elapsed=elapsed))
+
+
+def text_driver(target, mode, duration, inflight, rate, results):
+    """REQUEST_TIME traffic. Replies carry no ID, so they are paired FIFO."""
+    tracker = Tracker()
+    sent_at = []
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+        s.connect(target)
+
+        def send():
+            s.send(REQUEST)
+            sent_at.append(time.perf_counter())
+            tracker.sent += 1
+
+        def on_reply():
+            now = time.perf_counter()
+            tracker.received += 1
+            if sent_at:
+                tracker.histogram.record((now - sent_at.pop(0)) * 1_000_000)
+
+        start = time.perf_counter()
+        deadline = start + duration
+        interval = 1.0 / rate if mode == "open" else None
+        next_send = start
+        s.settimeout(WINDOW_TIMEOUT)
+        if mode == "closed":
+            for _ in range(inflight):
+                send()
+        while time.perf_counter() < deadline:
+            if mode == "open":
+                now = time.perf_counter()
+                while next_send <= now:
+                    send()
+                    next_send += interval
+                s.settimeout(max(0.0, next_send - time.perf_counter()))
+            try:
+                s.recv(64)
+            except (socket.timeout, BlockingIOError):
+                if mode == "closed":
+                    sent_at.clear()
+                    for _ in range(inflight):
+                        send()
+                continue
+            on_reply()
+            if mode == "closed":
+                send()
+        elapsed = time.perf_counter() - start
+        s.settimeout(DRAIN_SECONDS)
+        try:
+            while True:
+                s.recv(64)
+                on_reply()
+        except socket.timeout:
+            pass
+    results.put(dict(tracker.result(), elapsed=elapsed))
+
+
+def run_load(target, args):
+    driver = binary_driver if args.protocol == "binary" else text_driver
+    rate = args.rate / args.processes if args.mode == "open" else None
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(
+        target=driver, args=(target, args.mode, args.duration, args.inflight, rate, results))
+        for _ in range(args.processes)]
+    for w in workers:
+        w.start()
+    parts = [results.get() for _ in workers]
+    for w in workers:
+        w.join()
+
+    histogram = LogHistogram()
+    for part in parts:
+        histogram.merge(LogHistogram.from_state(part["histogram"]))
+    sent = sum(p["sent"] for p in parts)
+    received = sum(p["received"] for p in parts)
+    elapsed = max(p["elapsed"] for p in parts)
+    return {
+        "sent": sent,
+        "received": received,
+        "lost": sent - received,
+        "loss_rate": (sent - received) / sent if sent else 0.0,
+        "reordered": sum(p["reordered"] for p in parts),
+        "duplicates": sum(p["duplicates"] for p in parts),
+        "elapsed_s": elapsed,
+        "throughput_rps": received / elapsed if elapsed else 0.0,
+        "latency_us": histogram.summary(),
+    }
+
+
+def parse_target(value):
+    host, _, port = value.rpartition(":")
+    return socket.gethostbyname(host or "127.0.0.1"), int(port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UDP backend load generator and latency benchmark")
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    parser.add_argument("--inflight", type=int, default=16, help="closed loop: outstanding requests per process")
+    parser.add_argument("--rate", type=float, default=10000, help="open loop: total requests/second")
+    parser.add_argument("--processes", type=int, default=1, help="client processes")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds of load per run")
+    parser.add_argument("--protocol", choices=["binary", "text"], default="binary")
+    parser.add_argument("--engines", nargs="+", default=["blocking"],
+                        help="spawn a local backend per engine and benchmark each")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes of the spawned backend")
+    parser.add_argument("--target", type=parse_target, help="host:port of a running backend (no spawning)")
+    parser.add_argument("--json", metavar="FILE", help="write results here instead of stdout")
+    args = parser.parse_args()
+
+    runs = []
+    for engine in ([None] if args.target else args.engines):
+        backend = None
+        if args.target:
+            target = args.target
+        else:
+            target = ("127.0.0.1", free_port())
+            backend = spawn_backend(engine, target[1], args.workers)
+        try:
+            result = run_load(target, args)
+        finally:
+            if backend is not None:
+                backend.terminate()
+                backend.wait()
+        runs.append(dict(engine=engine, target=f"{target[0]}:{target[1]}", **result))
+        latency = result["latency_us"]
+        print(f"{engine or runs[-1]['target']:<12} {result['throughput_rps']:10.0f} req/s  "
+              f"loss {result['loss_rate']:.2%}  reordered {result['reordered']}  "
+              f"p50 {latency['p50'] or 0:.0f}us  p99 {latency['p99'] or 0:.0f}us  "
+              f"p99.9 {latency['p99.9'] or 0:.0f}us", file=sys.stderr)
+
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("target", "json", "engines")},
+        "runs": runs,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""One long-lived UDP socket shared by every Flask request thread.
+
+Instead of opening a socket per HTTP request, udp-client.py sends all binary
+time requests through a single `UdpChannel`. A receiver thread reads every
+reply and hands it to the waiting request through a `Future`, looked up by
+the request ID carried in the binary protocol (udp_protocol.py).
+
+A reply is delivered at most once: the pending entry is removed when the
+first matching reply arrives, so duplicates, replies that arrive after their
+request timed out, and replies from an unexpected address are counted and
+discarded instead of being handed to the wrong request.
+
+Timeouts are adaptive. Each backend has an `RttEstimator` (SRTT/RTTVAR as
+in TCP, RFC 6298) fed by successful requests. A request is retransmitted
+with the same request ID when its timeout (the RTO) expires, doubling the
+timeout each attempt up to `max_timeout`. If the first attempt is still
+unanswered after the `hedge_percentile` of recent RTTs, a hedged duplicate
+is sent. Whichever reply arrives first wins. Every reply echoes the t1 of
+the transmission it answers, so RTT samples stay unambiguous even after
+retransmissions.
+
+`request_burst` sends several probes at once for multi-probe clock syncs
+(clock_sync.filter_probes). It waits for the first reply (up to the RTO)
+and then gives the rest as long again, so an answered burst finishes in
+about two RTTs however many probes it sends. A burst with no reply at all
+is hedged and retransmitted as a whole, with the same backoff and
+counters as a single request: a dead backend still gets the full retry
+budget before the sync fails over or gives up.
+
+When the calling thread has a trace (tracing.py), its ID goes into every
+request of version 2 or later, and the time spent sending and waiting
+for replies is recorded as its "send" and "receive" spans.
+"""
+import collections
+import itertools
+import random
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, TimeoutError as FutureTimeout, wait
+
+import tracing
+import udp_protocol
+
+
+class RttEstimator:
+    """Smoothed RTT and RTT variance (RFC 6298), plus recent samples for percentiles."""
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+
+    def __init__(self, initial_rto=1.0, min_rto=0.02, max_rto=2.0, window=200):
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.srtt = None
+        self.rttvar = None
+        self._rto = initial_rto
+        self.samples = 0
+        self._recent = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, rtt):
+        with self._lock:
+            if self.srtt is None:
+                self.srtt = rtt
+                self.rttvar = rtt / 2
+            else:
+                self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+                self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+            self._rto = min(self.max_rto, max(self.min_rto, self.srtt + 4 * self.rttvar))
+            self.samples += 1
+            self._recent.append(rtt)
+
+    @property
+    def rto(self):
+        return self._rto
+
+    def percentile(self, q, min_samples=5):
+        """q-quantile of the recent RTTs, or None until there are enough samples."""
+        with self._lock:
+            if len(self._recent) < min_samples:
+                return None
+            ordered = sorted(self._recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def snapshot(self):
+        return {"srtt": self.srtt, "rttvar": self.rttvar, "rto": self.rto, "samples": self.samples}
+
+
+class UdpChannel:
+    def __init__(self, buffer_size=1024, retries=2, max_timeout=2.0, hedge_percentile=0.95):
+        self.buffer_size = buffer_size
+        self.retries = retries
+        self.max_timeout = max_timeout
+        self.hedge_percentile = hedge_percentile
+        self.estimators = {}  # backend address -> RttEstimator
+        self.sock = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+        self.sock.bind(("0.0.0.0", 0))
+        self._pending = {}  # request_id -> (Future, expected address)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(random.getrandbits(32))
+        self._thread = None
+        # Counters shown on the page
+        self.stale = 0       # late or duplicate replies
+        self.unexpected = 0  # non-protocol datagrams or replies from the wrong address
+        self.counters = {"requests": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "timeouts": 0}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._receive_loop, name="udp-receiver", daemon=True)
+        self._thread.start()
+        return self
+
+    def next_request_id(self):
+        return next(self._ids) & 0xFFFFFFFF
+
+    def send(self, data, address):
+        """Fire-and-forget datagram (admin commands)."""
+        self.sock.sendto(data, address)
+
+    def estimator(self, address):
+        estimator = self.estimators.get(address)
+        if estimator is None:
+            estimator = self.estimators.setdefault(address, RttEstimator(max_rto=self.max_timeout))
+        return estimator
+
+    def _count(self, name, counted=True):
+        if counted:
+            with self._lock:
+                self.counters[name] += 1
+
+    def _transmit(self, request_id, version, address, trace_id=0):
+        with tracing.span("send"):
+            t1 = udp_protocol.ntp_now()
+            self.sock.sendto(udp_protocol.encode_request(request_id, t1, version, trace_id), address)
+        return t1
+
+    def request_time(self, address, version, retries=None, hedge=True, counted=True):
+        """Send one binary time request and wait for its reply, retrying and
+        hedging as described above (`retries`/`hedge` override the defaults,
+        e.g. for health probes, which also pass counted=False to stay out of
+        the request counters).
+
+        Returns `(packet, t4)` where t4 is the NTP receive time. Raises
+        socket.timeout once the retry budget is used up.
+        """
+        estimator = self.estimator(address)
+        trace = tracing.current()
+        trace_id = trace.trace_id if trace is not None else 0
+        request_id = self.next_request_id()
+        future = Future()
+        with self._lock:
+            self._pending[request_id] = (future, address)
+        self._count("requests", counted)
+        retries = self.retries if retries is None else retries
+        hedge_t1 = None
+        waited = 0.0
+        try:
+            for attempt in range(retries + 1):
+                if attempt:
+                    self._count("retries", counted)
+                timeout = min(estimator.rto * (2 ** attempt), self.max_timeout)
+                deadline = time.monotonic() + timeout
+                self._transmit(request_id, version, address, trace_id)
+                try:
+                    if attempt == 0 and hedge and self.hedge_percentile:
+                        hedge_delay = estimator.percentile(self.hedge_percentile)
+                        if hedge_delay is not None and hedge_delay < timeout:
+                            try:
+                                with tracing.span("receive"):
+                                    result = future.result(hedge_delay)
+                                return self._complete(estimator, result, hedge_t1)
+                            except FutureTimeout:
+                                hedge_t1 = self._transmit(request_id, version, address, trace_id)
+                                self._count("hedges", counted)
+                    with tracing.span("receive"):
+                        result = future.result(max(0.0, deadline - time.monotonic()))
+                    return self._complete(estimator, result, hedge_t1)
+                except FutureTimeout:
+                    waited += timeout
+            self._count("timeouts", counted)
+            raise socket.timeout(f"{retries + 1} attempts in {waited:.2f}s")
+        finally:
+            with self._lock:
+                self._pending.pop(request_id, None)
+
+    def request_burst(self, address, version, count, retries=None, hedge=True):
+        """Send `count` binary time requests back to back, each with its own
+        request ID. If none is answered, the whole burst is hedged and
+        retried like a single request (see `request_time`). Returns the
+        `(packet, t4)` replies that arrived in time, in arrival order.
+        Raises socket.timeout once the retry budget is used up."""
+        estimator = self.estimator(address)
+        trace = tracing.current()
+        trace_id = trace.trace_id if trace is not None else 0
+        futures = {self.next_request_id(): Future() for _ in range(count)}
+        with self._lock:
+            for request_id, future in futures.items():
+                self._pending[request_id] = (future, address)
+        self._count("requests")
+        retries = self.retries if retries is None else retries
+        hedge_t1s = set()
+        waited = 0.0
+        done = None
+
+        def send_all():
+            sent = time.monotonic()
+            return sent, [self._transmit(request_id, version, address, trace_id) for request_id in futures]
+
+        def first_reply(timeout):
+            with tracing.span("receive"):
+                return wait(futures.values(), timeout=timeout, return_when=FIRST_COMPLETED)[0]
+
+        try:
+            for attempt in range(retries + 1):
+                if attempt:
+                    self._count("retries")
+                timeout = min(estimator.rto * (2 ** attempt), self.max_timeout)
+                deadline = time.monotonic() + timeout
+                sent, _ = send_all()
+                if attempt == 0 and hedge and self.hedge_percentile:
+                    hedge_delay = estimator.percentile(self.hedge_percentile)
+                    if hedge_delay is not None and hedge_delay < timeout:
+                        done = first_reply(hedge_delay)
+                        if not done:
+                            sent, t1s = send_all()
+                            hedge_t1s.update(t1s)
+                            self._count("hedges")
+                done = done or first_reply(max(0.0, deadline - time.monotonic()))
+                if done:
+                    # Probes left the socket together, so the rest should follow within one more RTT
+                    with tracing.span("receive"):
+                        wait(futures.values(), timeout=time.monotonic() - sent)
+                    break
+                waited += timeout
+            else:
+                self._count("timeouts")
+                raise socket.timeout(f"no reply to {count} probes, {retries + 1} attempts in {waited:.2f}s")
+        finally:
+            with self._lock:
+                for request_id in futures:
+                    self._pending.pop(request_id, None)
+        replies = sorted((f.result() for f in futures.values() if f.done()), key=lambda r: r[1])
+        # The fastest probe queued least: feed only it to the RTO estimate
+        estimator.observe(min((t4 - packet.t1) / 4294967296.0 for packet, t4 in replies))
+        if hedge_t1s and replies[0][0].t1 in hedge_t1s:
+            self._count("hedge_wins")
+        return replies
+
+    def _complete(self, estimator, result, hedge_t1):
+        packet, t4 = result
+        # t1 is echoed per transmission, so this RTT belongs to exactly one send
+        estimator.observe((t4 - packet.t1) / 4294967296.0)
+        if hedge_t1 is not None and packet.t1 == hedge_t1:
+            self._count("hedge_wins")
+        return result
+
+    def stats(self, address):
+        with self._lock:
+            counters = dict(self.counters, stale=self.stale, unexpected=self.unexpected)
+        estimator = self.estimator(address)
+        hedge = estimator.percentile(self.hedge_percentile) if self.hedge_percentile else None
+        return dict(estimator.snapshot(), hedge_delay=hedge, **counters)
+
+    def _receive_loop(self):
+        while True:
+            try:
+                data, address = self.sock.recvfrom(self.buffer_size)
+            except OSError:
+                continue
+            t4 = udp_protocol.ntp_now()
+            try:
+                packet = udp_protocol.decode(data)
+            except ValueError:
+                self.unexpected += 1
+                continue
+            with self._lock:
+                entry = self._pending.get(packet.request_id)
+                if entry is not None and entry[1] == address:
+                    del self._pending[packet.request_id]
+            if entry is None:
+                self.stale += 1
+            elif entry[1] != address:
+                self.unexpected += 1
+            elif not entry[0].done():
+                entry[0].set_result((packet, t4))
@@ -0,0 +1,162 @@
+"""Binary time protocol shared by udp-backend.py and udp-client.py.
+
+Every message is one fixed-size, big-endian datagram (32 bytes in
+version 1, 40 in version 2):
+
+    magic    2s   b"UT"
+    version  B    protocol version (see SUPPORTED_VERSIONS)
+    type     B    TYPE_REQUEST / TYPE_REPLY / TYPE_VERSION_NOT_SUPPORTED
+    req_id   I    chosen by the client, echoed by the server
+    t1       Q    client send time      (NTP 32.32 fixed point)
+    t2       Q    server receive time   (NTP 32.32 fixed point)
+    t3       Q    server transmit time  (NTP 32.32 fixed point)
+    trace_id Q    version 2 only: chosen by the client (tracing.py), echoed
+                  by the server, 0 = not traced
+
+TYPE_VERSION_NOT_SUPPORTED always uses the 32-byte version 1 layout, so any
+client can read it.
+
+Negotiation happens once, in ASCII, so that a legacy server never sees
+binary bytes: the client sends "HELLO_BINARY <highest version>" and the
+server answers "BINARY <version>" with the highest version both sides
+support. A legacy server answers "INVALID_REQUEST", and the client falls
+back to the text protocol ("REQUEST_TIME" -> '%Y-%m-%d %H:%M:%S.%f').
+If a binary request still carries a version the server does not know
+(e.g. after a downgrade), it answers TYPE_VERSION_NOT_SUPPORTED with its
+own highest version and the client renegotiates.
+"""
+import struct
+import time
+from collections import namedtuple
+
+MAGIC = b"UT"
+VERSION = 2
+SUPPORTED_VERSIONS = (1, 2)
+
+TYPE_REQUEST = 1
+TYPE_REPLY = 2
+TYPE_VERSION_NOT_SUPPORTED = 3
+
+HELLO = b"HELLO_BINARY"
+HELLO_REPLY = b"BINARY"
+
+PACKET = struct.Struct("!2sBBIQQQ")
+PACKET_SIZE = PACKET.size
+PACKET_V2 = struct.Struct("!2sBBIQQQQ")
+PACKET_V2_SIZE = PACKET_V2.size
+
+# Seconds between the NTP epoch (1900-01-01) and the Unix epoch (1970-01-01)
+NTP_EPOCH_OFFSET = 2208988800
+_NS = 1_000_000_000
+
+Packet = namedtuple("Packet", "version type request_id t1 t2 t3 trace_id")
+
+
+def to_ntp(ns):
+    """Unix time in nanoseconds -> 64-bit NTP fixed point."""
+    seconds, remainder = divmod(ns, _NS)
+    return ((seconds + NTP_EPOCH_OFFSET) << 32) | ((remainder << 32) // _NS)
+
+
+def from_ntp(value):
+    """64-bit NTP fixed point -> Unix time in seconds (float)."""
+    return (value >> 32) - NTP_EPOCH_OFFSET + (value & 0xFFFFFFFF) / 4294967296.0
+
+
+def ntp_now():
+    return to_ntp(time.time_ns())
+
+
+def encode_hello(version=VERSION):
+    return HELLO + b" %d" % version
+
+
+def answer_hello(data):
+    """Server side of the handshake: reply bytes, or None if unusable."""
+    try:
+        offered = int(bytes(data[len(HELLO):]).strip())
+    except ValueError:
+        return None
+    common = [v for v in SUPPORTED_VERSIONS if v <= offered]
+    return HELLO_REPLY + b" %d" % max(common) if common else None
+
+
+def parse_hello_reply(data):
+    """Client side of the handshake: agreed version, or None (text protocol)."""
+    if not data.startswith(HELLO_REPLY + b" "):
+        return None
+    try:
+        return int(data[len(HELLO_REPLY) + 1:])
+    except ValueError:
+        return None
+
+
+def encode_request(request_id, t1, version=VERSION, trace_id=0):
+    if version >= 2:
+        return PACKET_V2.pack(MAGIC, version, TYPE_REQUEST, request_id & 0xFFFFFFFF, t1, 0, 0, trace_id)
+    return PACKET.pack(MAGIC, version, TYPE_REQUEST, request_id & 0xFFFFFFFF, t1, 0, 0)
+
+
+def decode(data):
+    """Parse a datagram; raises ValueError if it is not a protocol message.
+    Version 1 messages decode with trace_id 0."""
+    if data[:2] != MAGIC:
+        raise ValueError("not a binary time protocol message")
+    if len(data) == PACKET_SIZE:
+        return Packet(*PACKET.unpack(data)[1:], 0)
+    if len(data) == PACKET_V2_SIZE:
+        return Packet(*PACKET_V2.unpack(data)[1:])
+    raise ValueError("not a binary time protocol message")
+
+
+def reply_buffers():
+    """Reusable output buffers for make_reply: one per message size."""
+    return bytearray(PACKET_SIZE), bytearray(PACKET_V2_SIZE)
+
+
+def make_reply(request, nbytes, t2, out):
+    """Write the answer to `request` into one of the buffers `out` (from
+    reply_buffers()).
+
+    `t2` is the server receive time (NTP). Returns the buffer written, or
+    None if the request is malformed (the caller then answers
+    INVALID_REQUEST). A version 2 request's trace ID is echoed.
+    """
+    if nbytes == PACKET_SIZE:
+        _, version, kind, request_id, t1, _, _ = PACKET.unpack_from(request)
+        trace_id = None
+    elif nbytes == PACKET_V2_SIZE:
+        _, version, kind, request_id, t1, _, _, trace_id = PACKET_V2.unpack_from(request)
+    else:
+        return None
+    if kind != TYPE_REQUEST:
+        return None
+    if version not in SUPPORTED_VERSIONS:
+        PACKET.pack_into(out[0], 0, MAGIC, VERSION, TYPE_VERSION_NOT_SUPPORTED, request_id, t1, 0, 0)
+        return out[0]
+    if (version == 1) != (trace_id is None):
+        return None  # size does not match the version
+    if trace_id is None:
+        PACKET.pack_into(out[0], 0, MAGIC, version, TYPE_REPLY, request_id, t1, t2, ntp_now())
+        return out[0]
+    PACKET_V2.pack_into(out[1], 0, MAGIC, version, TYPE_REPLY, request_id, t1, t2, ntp_now(), trace_id)
+    return out[1]
+
+
+def trace_id_of(request, nbytes):
+    """Trace ID carried by a binary request, or 0 (version 1 / untraced)."""
+    if nbytes != PACKET_V2_SIZE:
+        return 0
+    return int.from_bytes(request[PACKET_SIZE:PACKET_V2_SIZE], "big")
+
+
+def offset_and_delay(t1, t2, t3, t4):
+    """NTP clock offset and round-trip delay in seconds.
+
+    t1/t4 are the client's send/receive times, t2/t3 the server's
+    receive/transmit times, all as NTP fixed point.
+    """
+    # Differences are taken on the integers to keep full 32-bit fraction precision
+    offset = ((t2 - t1) + (t3 - t4)) / 2 / 4294967296.0
+    delay = ((t4 - t1) - (t3 - t2)) / 4294967296.0
+    return offset, delay
@@ -1,11 +1,37 @@
+import array
+import codecs
+import collections
+import hashlib
+import html
+import mmap
 import os
+import re
 import socket
-from flask import Flask, render_template_string, request, abort
+import threading
+import time
+from flask import Flask, Response, request, abort, jsonify, send_file
+
+import metrics
+from code_search import CodeSearch, SearchPolicy
 
 app = Flask(__name__)
+metrics.install(app)
 
 # Base directory for navigation
 BASE_DIR = os.getcwd()
+# Directories whose listing and rendered page are kept in memory
+LISTING_CACHE_SIZE = int(os.getenv("LISTING_CACHE_SIZE", "256"))
+# File viewer: streamed in chunks of VIEW_CHUNK bytes; line pages show PAGE_LINES lines
+VIEW_CHUNK = 64 * 1024
+PAGE_LINES = int(os.getenv("PAGE_LINES", "500"))
+# Files whose newline offset index is kept in memory
+LINE_INDEX_CACHE_SIZE = int(os.getenv("LINE_INDEX_CACHE_SIZE", "32"))
+# Code search: files larger than this or containing NUL bytes are not indexed
+SEARCH_MAX_FILE_SIZE = int(os.getenv("SEARCH_MAX_FILE_SIZE", str(1 << 20)))
+SEARCH_SKIP_DIRS = os.getenv("SEARCH_SKIP_DIRS", ".git,__pycache__,node_modules,.venv").split(",")
+SEARCH_SKIP_BINARY = os.getenv("SEARCH_SKIP_BINARY", "1") == "1"
+SEARCH_RESCAN_INTERVAL = float(os.getenv("SEARCH_RESCAN_INTERVAL", "5"))
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "200"))
 
 # Extended Configuration for the Dashboard
 # Removed 'slide' references
@@ -178,6 +204,11 @@ HTML_TEMPLATE = """
             <h2>📂 Source Code Explorer</h2>
             <p><strong>Current Directory:</strong> {{ current_path }}</p>
             
+            <form action="/search" method="get" style="margin-bottom: 15px;">
+                <input type="search" name="q" placeholder="Search all files (3+ characters)" minlength="3" style="width: 70%; padding: 6px; font-family: monospace;">
+                <button type="submit">🔍 Search</button>
+            </form>
+
             {% if current_path != base_dir %}
             <p><a href="/" style="font-weight: bold; text-decoration: none;">⬅ Back to Root</a></p>
             {% endif %}
@@ -185,14 +216,14 @@ HTML_TEMPLATE = """
             <h3>Folders</h3>
             <ul>
                 {% for folder in folders %}
-                <li>📂 <a href="/navigate?path={{ folder }}">{{ folder }}</a></li>
+                <li>📂 <a href="/navigate?path={{ folder|urlencode }}">{{ folder }}</a></li>
                 {% endfor %}
             </ul>
             
             <h3>Files</h3>
             <ul>
                 {% for file in files %}
-                <li>📄 <a href="/view?path={{ file }}">{{ file }}</a></li>
+                <li>📄 <a href="/view?path={{ file|urlencode }}">{{ file }}</a></li>
                 {% endfor %}
             </ul>
         </div>
@@ -201,18 +232,72 @@ HTML_TEMPLATE = """
 </html>
 """
 
+# Compiled once instead of on every request
+PAGE = app.jinja_env.from_string(HTML_TEMPLATE)
+
+class ListingCache:
+    """Bounded LRU of directory listings, each with its rendered page and ETag.
+
+    Adding, removing or renaming an entry bumps the directory's mtime, so an
+    entry is reused while the mtime is unchanged and a hit costs one stat().
+    An entry built less than a second after that mtime is not trusted: a
+    further change could land within the same mtime tick (git's "racy"
+    index check), so it is rebuilt on the next request."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._entries = collections.OrderedDict()  # path -> (mtime_ns, trusted, page, etag)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def page(self, path):
+        mtime = os.stat(path).st_mtime_ns
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == mtime and entry[1]:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[2], entry[3]
+        contents = list_directory(path)
+        page = PAGE.render(current_path=path, base_dir=BASE_DIR, services=LAB_SERVICES, **contents).encode()
+        etag = hashlib.sha1(page).hexdigest()[:16]
+        trusted = time.time_ns() - mtime > 1_000_000_000
+        with self._lock:
+            self._entries[path] = (mtime, trusted, page, etag)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+            self.misses += 1
+        return page, etag
+
+LISTINGS = ListingCache(LISTING_CACHE_SIZE)
+metrics.REGISTRY.callback("webserver_listing_cache_total", "Directory listing cache lookups",
+                          lambda: {"label": "result", "values": {"hit": LISTINGS.hits, "miss": LISTINGS.misses}},
+                          kind="counter")
+
+def listing_response(path):
+    """The cached dashboard page for `path`, or 304 if the browser has it."""
+    page, etag = LISTINGS.page(path)
+    response = Response(page, mimetype="text/html")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
 @app.route("/", methods=["GET"])
 def home():
-    contents = list_directory(BASE_DIR)
-    return render_template_string(HTML_TEMPLATE, current_path=BASE_DIR, base_dir=BASE_DIR, services=LAB_SERVICES, **contents)
+    return listing_response(BASE_DIR)
 
 def list_directory(path):
+    """One os.scandir pass; the entry type comes from the directory itself
+    (d_type), so plain files and folders need no extra stat() each.
+    Links are relative to BASE_DIR so nested folders navigate correctly."""
     try:
-        contents = os.listdir(path)
-        contents.sort()
+        with os.scandir(path) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
         return {
-            "folders": [item for item in contents if os.path.isdir(os.path.join(path, item))],
-            "files": [item for item in contents if os.path.isfile(os.path.join(path, item))]
+            "folders": [os.path.relpath(e.path, BASE_DIR) for e in entries if e.is_dir()],
+            "files": [os.path.relpath(e.path, BASE_DIR) for e in entries if e.is_file()]
         }
     except Exception as e:
         return {"folders": [], "files": [], "error": str(e)}
@@ -223,32 +308,201 @@ def navigate():
     if not folder_name: abort(400)
     new_path = os.path.join(BASE_DIR, folder_name)
     if os.path.isdir(new_path):
-        contents = list_directory(new_path)
-        return render_template_string(HTML_TEMPLATE, current_path=new_path, base_dir=BASE_DIR, services=LAB_SERVICES, **contents)
+        return listing_response(new_path)
     else: abort(404)
 
-@app.route("/view", methods=["GET"])
-def view_file():
+class LineIndexCache:
+    """Byte offset of the start of every line, per file, so a page of lines
+    is a single slice of the mapped file. An index stays valid while the
+    file's (mtime, size) is unchanged; at most `capacity` files are kept (LRU)."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._entries = collections.OrderedDict()  # path -> ((mtime_ns, size), offsets)
+        self._lock = threading.Lock()
+
+    def get(self, path, stat, data):
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == key:
+                self._entries.move_to_end(path)
+                return entry[1]
+        offsets = build_line_index(data)
+        with self._lock:
+            self._entries[path] = (key, offsets)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+        return offsets
+
+def build_line_index(data):
+    """Offsets of line starts, plus len(data) as the end of the last line."""
+    offsets = array.array("Q", [0])
+    offsets.extend(m.end() for m in re.finditer(b"\n", data))
+    if offsets[-1] != len(data):
+        offsets.append(len(data))  # last line has no trailing newline
+    return offsets
+
+LINE_INDEXES = LineIndexCache(LINE_INDEX_CACHE_SIZE)
+
+def map_file(file_path):
+    """Read-only mmap of the file and its stat. Empty files cannot be
+    mapped, so they come back as b""."""
+    with open(file_path, "rb") as file:
+        stat = os.fstat(file.fileno())
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b""
+    return data, stat
+
+def unmap(data):
+    if isinstance(data, mmap.mmap):
+        data.close()
+
+BUTTON = "display: inline-block; margin-top: 15px; margin-right: 8px; text-decoration: none; background: #2980b9; color: white; padding: 8px 15px; border-radius: 4px;"
+
+def view_header(file_name, nav=""):
+    name = html.escape(file_name)
+    link = html.escape(file_name, quote=True)
+    return f"""
+            <html>
+            <body style="font-family: monospace; background: #f4f7f6; padding: 20px;">
+                <div style="background: white; padding: 20px; border-radius: 8px; box-shadow: 0 2px 5px rgba(0,0,0,0.1);">
+                    <h2 style="margin-top:0; color: #2c3e50;">📄 {name}</h2>
+                    <p>
+                        <a href="/view?path={link}&start=1">Browse by lines</a> &middot;
+                        <a href="/raw?path={link}">Download raw</a>
+                    </p>
+                    {nav}
+                    <pre style="background: #2d3436; color: #dfe6e9; padding: 15px; border-radius: 5px; overflow-x: auto;">"""
+
+VIEW_FOOTER = f"""</pre>
+                    <a href="/" style="{BUTTON}">⬅ Back to Dashboard</a>
+                </div>
+            </body>
+            </html>
+            """
+
+def stream_file(file_name, data):
+    """The whole file, HTML-escaped chunk by chunk straight from the mapping,
+    so memory use does not grow with the file size."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    try:
+        yield view_header(file_name)
+        for pos in range(0, len(data), VIEW_CHUNK):
+            yield html.escape(decoder.decode(data[pos:pos + VIEW_CHUNK]), quote=False)
+        yield html.escape(decoder.decode(b"", final=True), quote=False)
+        yield VIEW_FOOTER
+    finally:
+        unmap(data)
+
+def line_page(file_name, file_path, data, stat, start, count):
+    """Lines start..start+count-1 (1-based), located through the line index."""
+    try:
+        offsets = LINE_INDEXES.get(file_path, stat, data)
+        total = len(offsets) - 1
+        start = max(1, min(start, max(total, 1)))
+        end = min(total, start + count - 1)
+        text = bytes(data[offsets[start - 1]:offsets[end]]).decode("utf-8", errors="replace")
+    finally:
+        unmap(data)
+    link = html.escape(file_name, quote=True)
+    before, after = start > 1, end < total
+    pages = [("⏮ First", 1, before), ("◀ Prev", max(1, start - count), before),
+             ("Next ▶", end + 1, after), ("Last ⏭", max(1, total - count + 1), after)]
+    buttons = "".join(f'<a href="/view?path={link}&start={line}&count={count}" style="{BUTTON}">{label}</a>'
+                      for label, line, shown in pages if shown)
+    nav = f"""<p>Lines <strong>{start if total else 0}–{end}</strong> of <strong>{total}</strong></p>
+                    <form action="/view" method="get" style="margin: 0;">
+                        <input type="hidden" name="path" value="{link}">
+                        <input type="hidden" name="count" value="{count}">
+                        Go to line <input type="number" name="start" min="1" max="{max(total, 1)}" value="{start}">
+                        <button type="submit">Go</button>
+                    </form>
+                    <div>{buttons}</div>"""
+    return view_header(file_name, nav) + html.escape(text, quote=False) + VIEW_FOOTER
+
+def resolve_file():
     file_name = request.args.get("path")
     if not file_name: abort(400)
-    file_path = os.path.join(BASE_DIR, file_name)
-    if os.path.isfile(file_path):
-        try:
-            with open(file_path, "r") as file: content = file.read()
-            # Added basic styling for the file viewer
-            return f"""
+    # Resolve symlinks and ".."; anything outside BASE_DIR does not exist here
+    base = os.path.realpath(BASE_DIR)
+    file_path = os.path.realpath(os.path.join(BASE_DIR, file_name))
+    if os.path.commonpath([file_path, base]) != base: abort(404)
+    if not os.path.isfile(file_path): abort(404)
+    return file_name, file_path
+
+@app.route("/view", methods=["GET"])
+def view_file():
+    """The whole file, streamed; or with ?start=N[&count=M] one page of lines."""
+    file_name, file_path = resolve_file()
+    try:
+        data, stat = map_file(file_path)
+    except Exception as e: abort(500, description=str(e))
+    start = request.args.get("start", type=int)
+    if start is None:
+        return Response(stream_file(file_name, data), mimetype="text/html")
+    count = max(1, min(request.args.get("count", PAGE_LINES, type=int), 10 * PAGE_LINES))
+    return line_page(file_name, file_path, data, stat, start, count)
+
+@app.route("/raw", methods=["GET"])
+def raw_file():
+    """The file as-is, with HTTP Range (resumable and partial downloads),
+    ETag and Last-Modified handled by send_file."""
+    file_name, file_path = resolve_file()
+    return send_file(file_path, as_attachment=True, conditional=True)
+
+SEARCH = CodeSearch(BASE_DIR, SearchPolicy(SEARCH_MAX_FILE_SIZE, SEARCH_SKIP_DIRS, SEARCH_SKIP_BINARY),
+                    rescan_interval=SEARCH_RESCAN_INTERVAL).start()
+
+def search_page(query, result):
+    """Human view of a search: one link per matching line."""
+    if "error" in result:
+        rows = f"<p>{html.escape(result['error'])}</p>"
+    else:
+        rows = "".join(
+            f"""<li><a href="/view?path={html.escape(m['path'], quote=True)}&start={max(1, m['line'] - 10)}&count=50">"""
+            f"""{html.escape(m['path'])}:{m['line']}</a> <code>{html.escape(m['text'])}</code></li>"""
+            for m in result["results"])
+        more = " (truncated)" if result["truncated"] else ""
+        rows = f"""<p>{len(result['results'])} matching lines{more} in {result['elapsed_ms']} ms
+                    &middot; {result['index']['indexed_files']} files indexed{"" if result['index']['ready'] else " so far"}</p>
+                    <ul style="list-style: none; padding: 0;">{rows}</ul>"""
+    return f"""
             <html>
             <body style="font-family: monospace; background: #f4f7f6; padding: 20px;">
                 <div style="background: white; padding: 20px; border-radius: 8px; box-shadow: 0 2px 5px rgba(0,0,0,0.1);">
-                    <h2 style="margin-top:0; color: #2c3e50;">📄 {file_name}</h2>
-                    <pre style="background: #2d3436; color: #dfe6e9; padding: 15px; border-radius: 5px; overflow-x: auto;">{content}</pre>
-                    <a href="/" style="display: inline-block; margin-top: 15px; text-decoration: none; background: #2980b9; color: white; padding: 8px 15px; border-radius: 4px;">⬅ Back to Dashboard</a>
+                    <h2 style="margin-top:0; color: #2c3e50;">🔍 {html.escape(query)}</h2>
+                    {rows}
+                    <a href="/" style="{BUTTON}">⬅ Back to Dashboard</a>
                 </div>
             </body>
             </html>
             """
-        except Exception as e: abort(500, description=str(e))
-    else: abort(404)
+
+@app.route("/search", methods=["GET"])
+def search():
+    """Matching lines (path, line number, text) for ?q=, from the trigram
+    index. JSON for programs, an HTML list for browsers."""
+    query = request.args.get("q", "")
+    limit = max(1, min(request.args.get("limit", SEARCH_MAX_RESULTS, type=int), SEARCH_MAX_RESULTS))
+    wants_json = request.accept_mimetypes.best_match(["application/json", "text/html"]) == "application/json"
+    if len(query) < 3:
+        result, status = {"error": "query must be at least 3 characters"}, 400
+    else:
+        started = time.perf_counter()
+        matches, files, truncated = SEARCH.search(query, limit)
+        result, status = {
+            "query": query,
+            "results": matches,
+            "truncated": truncated,
+            "candidate_files": len(files),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+            "index": SEARCH.stats(),
+        }, 200
+    if wants_json:
+        return jsonify(result), status
+    return search_page(query, result), status
 
 if __name__ == "__main__":
-    app.run(debug=True, host="0.0.0.0", port=5000)
\ No newline at end of file
+    # Development server; production runs through serve.py
+    app.run(debug=os.getenv("FLASK_DEBUG") == "1", host="0.0.0.0", port=5000)
\ No newline at end of file